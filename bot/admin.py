@@ -54,7 +54,19 @@ class MessageAdmin(admin.ModelAdmin):
 class EventAdmin(admin.ModelAdmin):
     search_fields = ['participants']
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.bump_version()
+
 
 @admin.register(Participant)
 class ParticipantAdmin(admin.ModelAdmin):
     search_fields = ['event', 'user']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.event.bump_version()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        obj.event.bump_version()
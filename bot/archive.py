@@ -0,0 +1,131 @@
+import gzip
+import json
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import Message
+
+
+FIELDS = ('id', 'message_id', 'date', 'user_id', 'content_type', 'data', 'event_id', 'created_at', 'updated_at')
+
+
+def month_of(date: int) -> str:
+    return datetime.fromtimestamp(date, timezone.utc).strftime('%Y-%m')
+
+
+def archive_path(month: str) -> str:
+    return os.path.join(settings.MESSAGE_ARCHIVE_DIR, f'messages-{month}.jsonl.gz')
+
+
+def archived_months() -> list[str]:
+    if not os.path.isdir(settings.MESSAGE_ARCHIVE_DIR):
+        return []
+    return sorted(
+        name[len('messages-'):-len('.jsonl.gz')]
+        for name in os.listdir(settings.MESSAGE_ARCHIVE_DIR)
+        if name.startswith('messages-') and name.endswith('.jsonl.gz')
+    )
+
+
+def _append(month: str, rows: list[dict]):
+    """
+    Every append is a new gzip member, readers see them as one stream
+    File is synced to disk before rows are deleted from database
+    """
+    os.makedirs(settings.MESSAGE_ARCHIVE_DIR, exist_ok=True)
+    with open(archive_path(month), 'ab') as file:
+        with gzip.GzipFile(fileobj=file, mode='wb') as gz:
+            for row in rows:
+                gz.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b'\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def archive_messages(before: datetime, batch_size=1000) -> Counter:
+    """
+    Moves messages, sent before `before`, to archive files by months, returns count of archived messages by months
+    If process is killed between append and delete, rows are archived twice, readers skip duplicates by id
+    """
+    cutoff = int(before.timestamp())
+    archived = Counter()
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Message.objects.filter(date__lt=cutoff).order_by('date', 'id').values(*FIELDS)[:batch_size]
+            )
+            if not rows:
+                return archived
+
+            for month, month_rows in groupby(rows, key=lambda row: month_of(row['date'])):
+                month_rows = list(month_rows)
+                _append(month, month_rows)
+                archived[month] += len(month_rows)
+            Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+
+def read_archive(
+    months: Optional[Iterable[str]] = None,
+    *,
+    user_id: Optional[int] = None,
+    event_id: Optional[int] = None,
+    content_type: Optional[str] = None,
+    contains: Optional[str] = None,
+) -> Iterator[dict]:
+    for month in months or archived_months():
+        if not os.path.exists(path := archive_path(month)):
+            continue
+
+        seen = set()
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            for line in file:
+                if contains and contains not in line:
+                    continue
+                row = json.loads(line)
+                if row['id'] in seen:
+                    continue
+                seen.add(row['id'])
+                if user_id is not None and row['user_id'] != user_id:
+                    continue
+                if event_id is not None and row['event_id'] != event_id:
+                    continue
+                if content_type is not None and row['content_type'] != content_type:
+                    continue
+                yield row
+
+
+def restore_messages(rows: Iterable[dict], batch_size=1000) -> int:
+    """
+    Returns messages to database with the same ids, messages, which are already there, are skipped
+    Restored messages are archived again by next run, if they are still old enough
+    """
+    restored = 0
+    batch = []
+    for row in rows:
+        batch.append(Message(**row))
+        if len(batch) == batch_size:
+            restored += _restore(batch)
+            batch = []
+    if batch:
+        restored += _restore(batch)
+    return restored
+
+
+def _restore(messages: list[Message]) -> int:
+    existing = set(Message.objects.filter(id__in=[message.id for message in messages]).values_list('id', flat=True))
+    messages = [message for message in messages if message.id not in existing]
+    timestamps = {message.id: (message.created_at, message.updated_at) for message in messages}
+    Message.objects.bulk_create(messages, ignore_conflicts=True)
+
+    # timestamps were overwritten by auto_now on create
+    for message in messages:
+        message.created_at, message.updated_at = map(parse_datetime, timestamps[message.id])
+    Message.objects.bulk_update(messages, ['created_at', 'updated_at'])
+    return len(messages)
@@ -0,0 +1,74 @@
+"""
+Benchmarks, run with `python manage.py bench [suite ...]`
+Each suite module has `run(number: int) -> dict` function
+"""
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Callable
+
+from django.db import connection
+
+SUITES = (
+    'callbacks',
+    'handler_backends',
+    'outbound',
+    'pairing',
+    'pipeline',
+    'startup',
+    'transport',
+    'translations',
+)
+
+
+def measure(fn: Callable, number: int) -> dict:
+    fn()  # warm up
+    started_at = perf_counter()
+    for _ in range(number):
+        fn()
+    elapsed = perf_counter() - started_at
+    return {'number': number, 'total_s': round(elapsed, 6), 'per_call_us': round(elapsed / number * 1e6, 3)}
+
+
+def percentiles(values: list[float]) -> dict:
+    """
+    p50, p95 and p99 of seconds, in milliseconds
+    """
+    values = sorted(values)
+    return {
+        f'p{percent}': round(values[min(len(values) - 1, len(values) * percent // 100)] * 1000, 3)
+        for percent in (50, 95, 99)
+    }
+
+
+@contextmanager
+def test_database():
+    """
+    Suites, which need data, use new database, as tests do
+    """
+    name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+
+@contextmanager
+def local_bot():
+    """
+    Bot with handlers and FakeBotAPI, which runs handlers in current thread, without rate limits and delays
+    """
+    from ..telegram.fake_api import FakeBotAPI
+    from ..telegram.outbound import OutboundScheduler
+
+    with FakeBotAPI() as api:
+        from ..telegram.handlers import bot, event_sync
+
+        threaded, outbound, sync_delay = bot.threaded, bot.outbound, event_sync.delay
+        bot.threaded = False  # so all queries and calls are made by the thread, which processes update
+        bot.outbound = OutboundScheduler(rate=1e9, chat_rate=1e9, chat_burst=1e9, group_rate_per_minute=1e9)
+        event_sync.delay = 0
+        try:
+            yield bot, api
+        finally:
+            bot.threaded, bot.outbound, event_sync.delay = threaded, outbound, sync_delay
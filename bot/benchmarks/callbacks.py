@@ -0,0 +1,44 @@
+import json
+
+from ..telegram.utils import callback
+
+# buttons of events screen, with big ids
+BUTTONS = [
+    (callback.events_main, (True,)),
+    (callback.events_settings, (123456789, True, False)),
+    (callback.event_admin, (123456789, 'distribute_users', 1)),
+    (callback.event_admin_type_edit, (123456789, 'gift_exchange')),
+    (callback.event_user_unsub, (123456789, 2)),
+]
+
+
+def json_create(cb: callback, data: tuple) -> str:  # how callback_data was created
+    return json.dumps([cb.value[0], data], separators=(',', ':'))
+
+
+def json_parse(data: str):  # how callback_data was parsed
+    _type, *callback_data = json.loads(data)
+    if callback_data:
+        callback_data = callback_data[0]
+    if isinstance(callback_data, dict):
+        return _type, [], callback_data
+    return _type, callback_data, {}
+
+
+def run(number: int) -> dict:
+    from . import measure
+
+    encoded = [cb.create(*data) for cb, data in BUTTONS]
+    encoded_json = [json_create(cb, data) for cb, data in BUTTONS]
+    return {
+        'json': {
+            'encode': measure(lambda: [json_create(cb, data) for cb, data in BUTTONS], number),
+            'decode': measure(lambda: [json_parse(data) for data in encoded_json], number),
+            'bytes': {cb.name: len(data) for (cb, _), data in zip(BUTTONS, encoded_json)},
+        },
+        'binary': {
+            'encode': measure(lambda: [cb.create(*data) for cb, data in BUTTONS], number),
+            'decode': measure(lambda: [callback.parse(data) for data in encoded], number),
+            'bytes': {cb.name: len(data) for (cb, _), data in zip(BUTTONS, encoded)},
+        },
+    }
@@ -0,0 +1,58 @@
+import json
+
+from picklefield.fields import dbsafe_decode, dbsafe_encode, wrap_conflictual_object
+from telebot import Handler
+
+from ..telegram.handler_backends import decode_handler, encode_handler, step_handler
+
+
+@step_handler('benchmark')
+def benchmark_step(message, lang, user_id: int, event_id: int, edit_type: str):
+    pass
+
+
+HANDLER = Handler(benchmark_step, 'en', 123456789, 42, edit_type='description')
+
+
+def pickle_register():  # how CallbackMessage with PickledObjectField columns was saved
+    return (
+        dbsafe_encode(wrap_conflictual_object(HANDLER.callback)),
+        dbsafe_encode(HANDLER.args),
+        dbsafe_encode(HANDLER.kwargs),
+    )
+
+
+def registry_register():
+    key, data = encode_handler(HANDLER)
+    return key, json.dumps(data)
+
+
+PICKLED = pickle_register()
+ENCODED = registry_register()
+
+
+def pickle_get():
+    fn, args, kwargs = (dbsafe_decode(value) for value in PICKLED)
+    return Handler(fn._obj, *args, **kwargs)
+
+
+def registry_get():
+    key, data = ENCODED
+    return decode_handler(key, json.loads(data))
+
+
+def run(number: int) -> dict:
+    from . import measure
+
+    return {
+        'pickle': {
+            'register': measure(pickle_register, number),
+            'get': measure(pickle_get, number),
+            'row_bytes': sum(len(value) for value in PICKLED),
+        },
+        'registry': {
+            'register': measure(registry_register, number),
+            'get': measure(registry_get, number),
+            'row_bytes': sum(len(value) for value in ENCODED),
+        },
+    }
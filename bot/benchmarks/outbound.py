@@ -0,0 +1,60 @@
+import threading
+from statistics import median
+from time import monotonic
+
+from telebot import TeleBot
+
+from ..telegram.fake_api import FakeBotAPI
+from ..telegram.outbound import BULK, OutboundScheduler
+
+BROADCAST_SIZE = 90  # 3 seconds of global limit
+INTERACTIVE_SIZE = 10
+
+
+def run(number: int) -> dict:
+    scheduler = OutboundScheduler(rate=30, chat_rate=1)
+    bot = TeleBot('1:fake', threaded=False)
+    sent_at = []
+    interactive_waits = []
+
+    def send(chat_id):
+        scheduler.call(chat_id, bot.send_message, chat_id, 'Hi')
+        sent_at.append(monotonic())
+
+    def broadcast():
+        with scheduler.lane(BULK):
+            for chat_id in range(BROADCAST_SIZE):
+                send(1000 + chat_id)
+
+    def interactive(chat_id):
+        started_at = monotonic()
+        send(chat_id)
+        interactive_waits.append(monotonic() - started_at)
+
+    with FakeBotAPI() as api:
+        api.add_error('sendMessage', 429, 'Too Many Requests: retry after 1', retry_after=1)
+        started_at = monotonic()
+        broadcaster = threading.Thread(target=broadcast)
+        broadcaster.start()
+        for chat_id in range(INTERACTIVE_SIZE):  # users click buttons, while broadcast is running
+            threading.Timer(0.5 + chat_id * 0.1, interactive, (chat_id + 1,)).start()
+        broadcaster.join()
+        while len(interactive_waits) < INTERACTIVE_SIZE:
+            threading.Event().wait(0.05)
+        elapsed = monotonic() - started_at
+        requests = api.count('sendMessage')
+
+    max_per_second = max(
+        sum(1 for other in sent_at if time <= other < time + 1)
+        for time in sent_at
+    )
+    return {
+        'messages': BROADCAST_SIZE + INTERACTIVE_SIZE,
+        'requests': requests,  # with retries
+        'total_s': round(elapsed, 3),
+        'max_messages_per_second': max_per_second,
+        'interactive_wait_s': {
+            'p50': round(median(interactive_waits), 3),
+            'max': round(max(interactive_waits), 3),
+        },
+    }
@@ -0,0 +1,52 @@
+from time import perf_counter
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..models import AuthUser, Event, Participant, User
+
+SIZES = (100, 1_000, 10_000, 20_000)
+
+
+def create_event(size: int) -> Event:
+    # ids of custom users are negative, and don't intersect between sizes
+    auth_users = AuthUser.objects.bulk_create(
+        AuthUser(id=-size * 10 - i, username=f'__benchmark_{size}_{i}', first_name=f'User {i}') for i in range(1, size + 1)
+    )
+    User.objects.bulk_create(User(user=auth_user, full_name=auth_user.first_name) for auth_user in auth_users)
+    event = Event.objects.create(admin_id=auth_users[0].id, name=f'Benchmark {size}', description='')
+    Participant.objects.bulk_create(Participant(user_id=auth_user.id, event=event) for auth_user in auth_users)
+    return event
+
+
+def is_single_cycle(participants: list[Participant]) -> bool:
+    buddies = {participant.id: participant.secret_good_buddy_id for participant in participants}
+    participant_id, visited = participants[0].id, 0
+    while True:
+        participant_id, visited = buddies[participant_id], visited + 1
+        if participant_id == participants[0].id:
+            return visited == len(participants)
+
+
+def run(number: int) -> dict:
+    from . import test_database
+
+    results = {}
+    with test_database():
+        for size in SIZES:
+            event = create_event(size)
+            with CaptureQueriesContext(connection) as queries:
+                started_at = perf_counter()
+                event.distribute_participants()
+                elapsed = perf_counter() - started_at
+            started_at = perf_counter()
+            event.distribute_participants()  # when buddies are already set
+            redistribute_elapsed = perf_counter() - started_at
+
+            results[size] = {
+                'total_s': round(elapsed, 3),
+                'redistribute_total_s': round(redistribute_elapsed, 3),
+                'queries': len(queries),
+                'single_cycle': is_single_cycle(list(event.participants.all())),
+            }
+    return results
@@ -0,0 +1,145 @@
+"""
+Synthetic updates, processed by the bot with fake Bot API and test database
+"""
+from collections import defaultdict
+from itertools import count
+from time import perf_counter, time
+from typing import Iterator
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from telebot import types
+
+from ..telegram.fake_api import BOT_USER
+
+ROUNDS = 20  # each round is one event: created, shared, joined, distributed
+PARTICIPANTS = 3
+LANGUAGES = ('en', 'uk', 'ru')
+
+update_ids = count(1)
+
+
+def user(user_id: int, language_code: str) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}', 'language_code': language_code}
+
+
+def message(user_id: int, text: str, language_code='en') -> dict:
+    update_id = next(update_ids)
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] if text.startswith('/') else []
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': user(user_id, language_code),
+            'text': text,
+            'entities': entities,
+        },
+    }
+
+
+def callback_query(user_id: int, data: str, language_code='en') -> dict:
+    update_id = next(update_ids)
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': user(user_id, language_code),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': '_',
+            },
+        },
+    }
+
+
+def inline_query(user_id: int, query='', language_code='en') -> dict:
+    update_id = next(update_ids)
+    return {
+        'update_id': update_id,
+        'inline_query': {'id': str(update_id), 'from': user(user_id, language_code), 'query': query, 'offset': ''},
+    }
+
+
+def chosen_inline_result(user_id: int, result_id: str, inline_message_id: str, language_code='en') -> dict:
+    return {
+        'update_id': next(update_ids),
+        'chosen_inline_result': {
+            'result_id': result_id,
+            'from': user(user_id, language_code),
+            'query': '',
+            'inline_message_id': inline_message_id,
+        },
+    }
+
+
+def scenario(event_number: int) -> Iterator[tuple[str, dict]]:
+    """
+    Updates of one event, with names of handlers
+    """
+    from ..models import Event
+    from ..telegram.utils import callback as cb
+
+    admin_id = 1000 + event_number * 100  # bot itself is user 1
+    yield 'start', message(admin_id, '/start')
+    yield 'new_event', message(admin_id, '/new_event')
+    yield 'new_event_name', message(admin_id, f'Event {event_number}')
+    yield 'new_event_description', message(admin_id, 'Gifts up to 10$')
+    event_id = Event.objects.filter(admin_id=admin_id).values_list('id', flat=True).last()
+
+    yield 'events', message(admin_id, '/events')
+    yield 'events_settings', callback_query(admin_id, cb.events_settings.create(event_id))
+    yield 'inline_query', inline_query(admin_id)
+    yield 'chosen_inline_result', chosen_inline_result(admin_id, f'{event_id}|', f'inline-{event_id}')
+
+    for i in range(1, PARTICIPANTS + 1):
+        yield 'start_join', message(admin_id + i, f'/start {event_id}', LANGUAGES[i % len(LANGUAGES)])
+
+    yield 'register_close', callback_query(admin_id, cb.event_admin.create(event_id, 'register_close'))
+    yield 'distribute_users', callback_query(admin_id, cb.event_admin.create(event_id, 'distribute_users'))
+    yield 'send_santa', message(admin_id + 1, '/send_santa')
+    yield 'send_santa_message', message(admin_id + 1, 'Hi, Santa!')
+
+
+def run(number: int) -> dict:
+    from . import local_bot, percentiles, test_database
+
+    latencies = defaultdict(list)
+    queries = defaultdict(int)
+    api_calls = defaultdict(int)
+
+    with local_bot() as (bot, api), test_database():
+        started_at = perf_counter()
+        for event_number in range(ROUNDS):
+            for handler, data in scenario(event_number):
+                update = types.Update.de_json(data)
+                api_calls_before = api.count()
+                with CaptureQueriesContext(connection) as captured:
+                    update_started_at = perf_counter()
+                    bot.process_new_updates([update])
+                    latencies[handler].append(perf_counter() - update_started_at)
+                queries[handler] += len(captured)
+                api_calls[handler] += api.count() - api_calls_before
+        elapsed = perf_counter() - started_at
+
+    updates = sum(len(values) for values in latencies.values())
+    return {
+        'updates': updates,
+        'updates_per_second': round(updates / elapsed, 1),
+        'latency_ms': percentiles(sum(latencies.values(), [])),
+        'handlers': {
+            handler: {
+                'updates': len(values),
+                'latency_ms': percentiles(values),
+                'queries_per_update': round(queries[handler] / len(values), 2),
+                'api_calls_per_update': round(api_calls[handler] / len(values), 2),
+            }
+            for handler, values in latencies.items()
+        },
+    }
@@ -0,0 +1,60 @@
+"""
+Cold boot of worker: new python process sets up django and imports urls, as web worker does,
+then imports handlers, as it's done on first update. Bot API is fake, to count requests made on boot
+"""
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+from django.conf import settings
+
+BOOT = '''
+import json, os
+from time import perf_counter
+
+started_at = perf_counter()
+from telebot import apihelper
+apihelper.API_URL = os.environ['FAKE_BOT_API_URL']
+
+import django
+django.setup()
+setup_at = perf_counter()
+import bot.urls
+urls_at = perf_counter()
+import bot.telegram.handlers
+handlers_at = perf_counter()
+
+print(json.dumps({
+    'django_setup_s': setup_at - started_at,
+    'urls_import_s': urls_at - setup_at,
+    'handlers_import_s': handlers_at - urls_at,
+}))
+'''
+MAX_BOOTS = 10
+
+
+def run(number: int) -> dict:
+    from . import percentiles
+    from ..telegram.fake_api import FakeBotAPI
+
+    boots = min(number, MAX_BOOTS)
+    stages = {'process_s': []}
+    with FakeBotAPI() as api:
+        env = {**os.environ, 'FAKE_BOT_API_URL': api.url + '/bot{0}/{1}'}
+        for _ in range(boots):
+            started_at = perf_counter()
+            output = subprocess.run(
+                [sys.executable, '-c', BOOT], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            )
+            stages['process_s'].append(perf_counter() - started_at)
+            for name, seconds in json.loads(output.stdout.splitlines()[-1]).items():
+                stages.setdefault(name, []).append(seconds)
+        api_calls = api.count()
+
+    return {
+        'boots': boots,
+        **{name.removesuffix('_s') + '_ms': percentiles(values) for name, values in stages.items()},
+        'bot_api_calls_per_boot': api_calls / boots,
+    }
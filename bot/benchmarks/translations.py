@@ -0,0 +1,54 @@
+from functools import partial
+
+from django.utils.translation.trans_real import translation
+
+from ..telegram.utils import get_multi_trans, get_trans
+
+JOIN_TEXT = '''
+Welcome to <b>{event.name}</b>
+{event.description}
+
+Participants:
+{participants_text}
+Click here to join this event
+'''
+LANGS = ('uk', 'en', 'ru')
+
+
+def django_multi_gettext(get_text_list, text, sep='\n'):  # how multi-language strings were translated
+    return sep.join(get_text(text) for get_text in get_text_list)
+
+
+def django_render():
+    _ = partial(django_multi_gettext, [translation(lang).gettext for lang in LANGS])
+    return _(JOIN_TEXT)
+
+
+def catalog_render():
+    _ = get_multi_trans(*LANGS)
+    return _(JOIN_TEXT)
+
+
+def django_handler():
+    _ = translation('uk').gettext
+    return _('Hi User') + _('/start /help - Show this message') + _('/events - Settings for your events')
+
+
+def catalog_handler():
+    _ = get_trans('uk')
+    return _('Hi User') + _('/start /help - Show this message') + _('/events - Settings for your events')
+
+
+def run(number: int) -> dict:
+    from . import measure
+
+    return {
+        'django': {
+            'join_text_render': measure(django_render, number),
+            'handler_strings': measure(django_handler, number),
+        },
+        'catalog': {
+            'join_text_render': measure(catalog_render, number),
+            'handler_strings': measure(catalog_handler, number),
+        },
+    }
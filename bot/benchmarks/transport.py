@@ -0,0 +1,57 @@
+"""
+Requests of broadcast to fake Bot API with latency: default sessions of apihelper (one per thread),
+pooled transport with requests one by one and with concurrent requests
+"""
+from time import perf_counter
+
+from telebot import apihelper
+
+from ..telegram.transport import PooledTransport
+
+MESSAGES = 200
+LATENCY = 0.005  # seconds
+CONCURRENCY = 8
+
+
+def broadcast(api, transport) -> dict:
+    from . import percentiles
+
+    previous_sender = apihelper.CUSTOM_REQUEST_SENDER
+    apihelper.CUSTOM_REQUEST_SENDER = transport
+    api.reset()
+    latencies = []
+
+    def send(chat_id: int):
+        started_at = perf_counter()
+        apihelper.send_message('1:fake', chat_id, 'Hey! Event started!')
+        latencies.append(perf_counter() - started_at)
+
+    started_at = perf_counter()
+    try:
+        chat_ids = range(1, MESSAGES + 1)
+        if transport is not None and transport.executor is not None:
+            list(transport.executor.map(send, chat_ids))
+        else:
+            for chat_id in chat_ids:
+                send(chat_id)
+    finally:
+        apihelper.CUSTOM_REQUEST_SENDER = previous_sender
+    elapsed = perf_counter() - started_at
+
+    return {
+        'messages': MESSAGES,
+        'total_s': round(elapsed, 3),
+        'latency_ms': percentiles(latencies),
+        'connections': api.connections,
+    }
+
+
+def run(number: int) -> dict:
+    from ..telegram.fake_api import FakeBotAPI
+
+    with FakeBotAPI(latency=LATENCY) as api:
+        return {
+            'apihelper_session': broadcast(api, None),
+            'pooled': broadcast(api, PooledTransport(pool_size=CONCURRENCY)),
+            'pooled_concurrent': broadcast(api, PooledTransport(pool_size=CONCURRENCY, concurrency=CONCURRENCY)),
+        }
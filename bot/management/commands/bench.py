@@ -0,0 +1,29 @@
+import json
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = 'Run benchmarks (see bot/benchmarks) and print results as json'
+    requires_system_checks = []  # checks import urls, and so the whole bot
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help=f'Any of: {", ".join(SUITES)}. All by default')
+        parser.add_argument('--number', type=int, default=1000, help='Iterations of each measured call')
+        parser.add_argument('--output', help='Also save results to this json file, to compare runs')
+
+    def handle(self, *args, suites, number, output, **options):
+        if unknown := set(suites) - set(SUITES):
+            raise CommandError(f'Unknown suites: {", ".join(unknown)}')
+
+        results = {}
+        for suite in suites or SUITES:
+            results[suite] = import_module(f'bot.benchmarks.{suite}').run(number=number)
+            self.stdout.write(json.dumps({suite: results[suite]}, indent=2))
+
+        if output:
+            with open(output, 'w') as file:
+                json.dump(results, file, indent=2)
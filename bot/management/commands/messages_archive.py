@@ -0,0 +1,48 @@
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...archive import archive_messages, archived_months, read_archive, restore_messages
+
+
+class Command(BaseCommand):
+    help = (
+        'Archive of old messages (see MESSAGE_RETENTION_DAYS, MESSAGE_ARCHIVE_DIR):\n'
+        '  archive - move messages older than retention to archive files\n'
+        '  query - print archived messages as JSON lines\n'
+        '  restore - return archived messages to database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['archive', 'query', 'restore'])
+        parser.add_argument('--older-than-days', type=int, default=settings.MESSAGE_RETENTION_DAYS)
+        parser.add_argument('--month', action='append', dest='months', help='YYYY-MM, all months by default')
+        parser.add_argument('--user', type=int, dest='user_id')
+        parser.add_argument('--event', type=int, dest='event_id')
+        parser.add_argument('--content-type')
+        parser.add_argument('--contains', help='Substring of JSON line')
+
+    def handle(self, *args, action, older_than_days, months, **options):
+        if action == 'archive':
+            archived = archive_messages(timezone.now() - timedelta(days=older_than_days))
+            for month, count in sorted(archived.items()):
+                self.stdout.write(f'{month}: {count} messages')
+            self.stdout.write(self.style.SUCCESS(f'Archived {sum(archived.values())} messages'))
+            return
+
+        rows = read_archive(
+            months,
+            user_id=options['user_id'],
+            event_id=options['event_id'],
+            content_type=options['content_type'],
+            contains=options['contains'],
+        )
+        if action == 'query':
+            for row in rows:
+                self.stdout.write(json.dumps(row, ensure_ascii=False))
+        else:
+            restored = restore_messages(rows)
+            self.stdout.write(self.style.SUCCESS(f'Restored {restored} messages from {months or archived_months()}'))
@@ -0,0 +1,32 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...models import MetricsSnapshot
+from ...telegram.handler_backends import DjangoHandlerBackend
+from ...telegram.metrics import Publisher
+from ...telegram.update_queue import DatabaseUpdateQueue
+
+
+class Command(BaseCommand):
+    help = 'Process telegram updates, saved to database by webhook (BOT_UPDATE_QUEUE=db)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.BOT_UPDATE_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to wait, when queue is empty')
+
+    def handle(self, *args, workers, batch_size, interval, **options):
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+        DjangoHandlerBackend.enable_index()  # this process is the only one, who handles updates
+
+        publisher = Publisher(MetricsSnapshot.store, settings.BOT_METRICS_INTERVAL).start()  # rendered by web
+        self.stdout.write(f'Processing updates with {workers} workers')
+        DatabaseUpdateQueue(workers).drain(stop, batch_size=batch_size, interval=interval)
+        publisher.stop()
+        self.stdout.write('Stopped')
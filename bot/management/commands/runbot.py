@@ -0,0 +1,35 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...models import MetricsSnapshot
+from ...telegram.bot import bot
+from ...telegram.handler_backends import DjangoHandlerBackend
+from ...telegram.metrics import Publisher
+from ...telegram.update_queue import PollingUpdateQueue
+
+
+class Command(BaseCommand):
+    help = 'Run bot with long polling of getUpdates instead of webhook, webhook is removed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.BOT_UPDATE_WORKERS)
+        parser.add_argument('--max-in-flight', type=int, default=100, help='Updates, which are processed at once')
+        parser.add_argument('--timeout', type=int, default=20, help='Seconds of long polling, also time of shutdown')
+
+    def handle(self, *args, workers, max_in_flight, timeout, **options):
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+        bot.threaded = False  # workers run handlers by themselves, to keep updates of chat in order
+        bot.delete_webhook()  # getUpdates doesn't work, while webhook is set
+        DjangoHandlerBackend.enable_index()  # this process is the only one, who handles updates
+
+        publisher = Publisher(MetricsSnapshot.store, settings.BOT_METRICS_INTERVAL).start()  # rendered by web
+        self.stdout.write(f'Polling updates with {workers} workers')
+        PollingUpdateQueue(bot.token, workers, max_in_flight).poll(stop, timeout=timeout)
+        publisher.stop()
+        self.stdout.write('Stopped')
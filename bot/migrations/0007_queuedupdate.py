@@ -0,0 +1,28 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_alter_event_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('update_id', models.BigIntegerField(unique=True)),
+                ('chat_id', models.BigIntegerField()),
+                ('data', models.JSONField()),
+                ('taken_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:26
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def seed_sequences(apps, schema_editor):
+    AuthUser = apps.get_model('bot', 'AuthUser')
+    Message = apps.get_model('bot', 'Message')
+    IdSequence = apps.get_model('bot', 'IdSequence')
+
+    min_user_id = AuthUser.objects.aggregate(min_id=Min('id'))['min_id'] or 0
+    min_message_id = Message.objects.aggregate(min_id=Min('message_id'))['min_id'] or 0
+    IdSequence.objects.bulk_create([
+        IdSequence(name='auth_user', value=min(0, min_user_id) - 1),
+        IdSequence(name='message', value=min(0, min_message_id) - 1),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0007_queuedupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
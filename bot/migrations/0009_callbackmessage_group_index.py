@@ -0,0 +1,17 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_idsequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callbackmessage',
+            index=models.Index(fields=['handler_id', 'group_id'], name='callback_message_group_idx'),
+        ),
+    ]
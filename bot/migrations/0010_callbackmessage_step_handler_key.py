@@ -0,0 +1,83 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:40
+
+import pickle
+from base64 import b64decode
+from io import BytesIO
+
+from django.db import migrations, models
+
+
+# keys of bot.telegram.handlers functions, registered with @step_handler
+STEP_HANDLER_KEYS = {
+    'send_your_buddy_or_santa_message': 'send_buddy_or_santa',
+    'new_event_command_name': 'new_event_name',
+    'new_event_command_description': 'new_event_description',
+    'event_admin_edit': 'event_admin_edit',
+}
+
+
+class FunctionNameUnpickler(pickle.Unpickler):
+    # pickled functions are loaded as their names, so handlers module (and bot) is not imported here
+    def find_class(self, module, name):
+        if module.startswith('bot.'):
+            return name
+        return super().find_class(module, name)
+
+
+def load_pickled(value: str):
+    obj = FunctionNameUnpickler(BytesIO(b64decode(value))).load()
+    return getattr(obj, '_obj', obj)  # picklefield wraps callables with _ObjectWrapper
+
+
+def pickle_to_json(apps, schema_editor):
+    CallbackMessage = apps.get_model('bot', 'CallbackMessage')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT id, fn, args, kwargs FROM {CallbackMessage._meta.db_table}')
+        rows = cursor.fetchall()
+
+    unknown_ids = []
+    for _id, fn, args, kwargs in rows:
+        try:
+            key = STEP_HANDLER_KEYS[load_pickled(fn)]
+            data = [list(load_pickled(args)), load_pickled(kwargs)]
+        except Exception:
+            unknown_ids.append(_id)
+            continue
+        CallbackMessage.objects.filter(id=_id).update(key=key, data=data)
+
+    CallbackMessage.objects.filter(id__in=unknown_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_callbackmessage_group_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='callbackmessage',
+            name='key',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='callbackmessage',
+            name='data',
+            field=models.JSONField(default=list),
+        ),
+        migrations.RunPython(pickle_to_json, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='callbackmessage',
+            name='fn',
+        ),
+        migrations.RemoveField(
+            model_name='callbackmessage',
+            name='args',
+        ),
+        migrations.RemoveField(
+            model_name='callbackmessage',
+            name='kwargs',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_callbackmessage_step_handler_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
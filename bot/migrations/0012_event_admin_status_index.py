@@ -0,0 +1,17 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0011_event_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['admin', 'status'], name='event_admin_status_idx'),
+        ),
+    ]
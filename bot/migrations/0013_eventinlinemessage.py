@@ -0,0 +1,46 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_inline_messages(apps, schema_editor):
+    Message = apps.get_model('bot', 'Message')
+    EventInlineMessage = apps.get_model('bot', 'EventInlineMessage')
+
+    inline_messages = Message.objects.filter(event__isnull=False, data__has_key='inline_message_id').values_list(
+        'event_id', 'data__inline_message_id',
+    )
+    EventInlineMessage.objects.bulk_create(
+        (
+            EventInlineMessage(event_id=event_id, inline_message_id=inline_message_id)
+            for event_id, inline_message_id in inline_messages.iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_event_admin_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventInlineMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('inline_message_id', models.CharField(max_length=256, unique=True)),
+                ('last_rendered_hash', models.CharField(default='', max_length=32)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='inline_messages', to='bot.event')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(copy_inline_messages, migrations.RunPython.noop),
+    ]
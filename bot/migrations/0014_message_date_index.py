@@ -0,0 +1,17 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_eventinlinemessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['date'], name='message_date_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0014_message_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpdateOffset',
+            fields=[
+                ('bot_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('offset', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.12 on 2026-10-17 21:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0015_updateoffset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotProfile',
+            fields=[
+                ('bot_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.12 on 2026-10-17 22:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0016_botprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricsSnapshot',
+            fields=[
+                ('process', models.CharField(max_length=256, primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,7 +1,8 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import threading
 from typing import Union, Optional
 
 from django.db.models import (
@@ -9,24 +10,37 @@ from django.db.models import (
     Model,
     DO_NOTHING,
     SET_NULL,
-    Min,
+    F,
+    Q,
+    Case,
+    When,
+    Value,
+    Index,
     ForeignKey,
     OneToOneField,
     BigIntegerField,
     PositiveSmallIntegerField as TinyInt,
+    PositiveIntegerField,
     BooleanField,
     CharField,
     TextField,
     JSONField,
     DateTimeField,
 )
+from django.conf import settings
+from django.db import connection, transaction
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.safestring import mark_safe
-from picklefield.fields import PickledObjectField
 
 from telebot import types
 
-from .telegram.utils import html_user_url, random_str
+from .telegram.identity_cache import IdentityCache
+from .telegram.instrumentation import hot_path_time
+from .telegram.journal import WriteBehindJournal
+from .telegram.metrics import merge, timed
+from .telegram.reachability import ReachabilityTracker
+from .telegram.utils import html_user_url, random_str, single_cycle
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -78,6 +92,46 @@ class Base(Model):
         return self
 
 
+class IdSequence(Model):
+    """
+    Source of synthetic negative ids (users, created by admin; messages without telegram id)
+    """
+    name = CharField(max_length=64, primary_key=True)
+    value = BigIntegerField()  # next id to give, ids are decreasing
+
+    @classmethod
+    def reserve(cls, name: str, count: int) -> int:
+        """
+        Returns first id of reserved range [first, first - count)
+        """
+        with transaction.atomic():
+            cls.objects.filter(name=name).update(value=F('value') - count)  # row is locked until commit
+            return cls.objects.values_list('value', flat=True).get(name=name) + count
+
+
+class IdAllocator:
+    def __init__(self, name: str, block_size: int = 1):
+        self.name = name
+        self.block_size = block_size
+        self._next = 0
+        self._left = 0
+        self._lock = threading.Lock()
+
+    def allocate(self) -> int:
+        with self._lock:
+            if not self._left:
+                self._next = IdSequence.reserve(self.name, self.block_size)
+                self._left = self.block_size
+            _id = self._next
+            self._next -= 1
+            self._left -= 1
+            return _id
+
+
+auth_user_ids = IdAllocator('auth_user')
+message_ids = IdAllocator('message', block_size=100)
+
+
 class User(Base):
     is_bot = BooleanField(default=False)
     full_name = CharField(**NOT_REQUIRED, max_length=256)
@@ -103,8 +157,37 @@ class User(Base):
     def to_html(self):
         return html_user_url(self.user)
 
+    @staticmethod
+    def tg_fingerprint(user: types.User) -> tuple:
+        return user.first_name, user.last_name, user.username, user.language_code, user.is_bot
+
+    @classmethod
+    @timed(hot_path_time, function='User.create_from_tg')
+    def create_from_tg(cls, user: types.User) -> tuple[User, bool]:
+        """
+        Profile is saved only if it was changed since last call, otherwise User is only loaded (once per update)
+        """
+        fingerprint = cls.tg_fingerprint(user)
+        if cached_user := tg_users_cache.get(user.id, fingerprint):
+            reachability.remember(user.id, cached_user.bot_can_message)
+            return cached_user, False
+
+        result = cls._update_or_create_from_tg(user)
+        tg_users_cache.set(user.id, fingerprint, result[0])
+        reachability.remember(user.id, result[0].bot_can_message)
+        return result
+
     @classmethod
-    def create_from_tg(cls, user: types.User):
+    def save_from_tg(cls, user: types.User) -> int:
+        """
+        Profile is saved only if it was changed since last call, User isn't loaded, only its id is returned
+        """
+        if not tg_users_cache.is_saved(user.id, cls.tg_fingerprint(user)):
+            cls.create_from_tg(user)
+        return user.id
+
+    @classmethod
+    def _update_or_create_from_tg(cls, user: types.User) -> tuple[User, bool]:
         username = user.username or f'__{user.id}'
 
         return cls.objects.update_or_create(
@@ -126,19 +209,39 @@ class User(Base):
 
     @classmethod
     def create_new_auth_user(cls, **kwargs):
-        min_id = AuthUser.objects.annotate(min_id=Min('id')).values()[0]['min_id']
         # custom users will have negative ids :)
-
         return AuthUser.objects.create(
-            id=min(0, min_id) - 1,
+            id=auth_user_ids.allocate(),
             username='__' + random_str(50),
             **kwargs,
         )
 
+    @classmethod
+    def save_reachability(cls, states: list[tuple[int, bool]]):
+        """
+        One query for batch of users, only rows with changed bot_can_message are written
+        """
+        reachable = [user_id for user_id, can_message in states if can_message]
+        can_message = Case(
+            When(user_id__in=reachable, then=Value(True)), default=Value(False), output_field=BooleanField(),
+        )
+        cls.objects.filter(user_id__in=[user_id for user_id, _ in states]).exclude(
+            bot_can_message=can_message,
+        ).update(bot_can_message=can_message)
+
     class Meta:
         ordering = ['full_name']
 
 
+tg_users_cache = IdentityCache(
+    lambda user_id: User.objects.get(user_id=user_id),
+    maxsize=settings.BOT_USER_CACHE_SIZE, ttl=settings.BOT_USER_CACHE_TTL,
+)
+reachability = ReachabilityTracker(
+    User.save_reachability, maxsize=settings.BOT_USER_CACHE_SIZE, ttl=settings.BOT_REACHABILITY_TTL,
+)
+
+
 class Message(Base):
     message_id = BigIntegerField()
     date = BigIntegerField()
@@ -153,23 +256,78 @@ class Message(Base):
 
     class Meta:
         ordering = ['message_id']
+        indexes = [Index(fields=['date'], name='message_date_idx')]  # retention, see archive.py
 
     @classmethod
+    @timed(hot_path_time, function='Message.add_tg_message')
     def add_tg_message(cls, message: Union[types.Message, types.CallbackQuery]) -> Message:
+        """
+        Message is saved when current batch of message journal is finished (usually - at the end of update)
+        """
         _date = getattr(getattr(message, 'message', message), 'date', None) or datetime.utcnow().timestamp()
         _id = getattr(message, 'id', None)
-        if not _id:
-            min_id = cls.objects.annotate(min_id=Min('id')).values()[0]['min_id']
-            _id = min(0, min_id) - 1
-        return cls.objects.update_or_create(
+        user_id = User.save_from_tg(message.from_user)
+        db_message = cls(
             message_id=_id,
             date=_date,
-            user=User.create_from_tg(message.from_user)[0],
-            defaults=dict(
-                content_type=getattr(message, 'content_type', 'callback_query'),
-                data=getattr(message, 'json', message.__dict__),
-            ),
-        )[0]
+            user_id=user_id,
+            content_type=getattr(message, 'content_type', 'callback_query'),
+            data=getattr(message, 'json', message.__dict__),
+        )
+        # messages without id will get new id on save, so the same object is used as key
+        key = (_id, _date, user_id) if _id else id(message)
+        return message_journal.add(key, db_message, merge=cls._merge)
+
+    @staticmethod
+    def _merge(old: Message, new: Message) -> Message:
+        old.content_type = new.content_type
+        old.data = new.data
+        return old
+
+    @classmethod
+    def bulk_save(cls, messages: list[Message]):
+        for message in messages:
+            if not message.message_id:
+                message.message_id = message_ids.allocate()
+
+        lookup = Q()
+        for message in messages:
+            lookup |= Q(message_id=message.message_id, date=message.date, user_id=message.user_id)
+        existing = {
+            (message_id, date, user_id): pk
+            for pk, message_id, date, user_id in cls.objects.filter(lookup).values_list(
+                'id', 'message_id', 'date', 'user_id'
+            )
+        }
+
+        new_messages = []
+        updated_messages = []
+        now = timezone.now()
+        for message in messages:
+            message.id = existing.get((message.message_id, message.date, message.user_id))
+            if message.id is None:
+                new_messages.append(message)
+            else:
+                message.updated_at = now
+                updated_messages.append(message)
+
+        # bulk_create(update_conflicts=True) is not available in Django 3.2, so it costs one select more
+        if new_messages:
+            cls.objects.bulk_create(new_messages)
+        if updated_messages:
+            cls.objects.bulk_update(updated_messages, ['content_type', 'data', 'updated_at'])
+
+
+message_journal = WriteBehindJournal(Message.bulk_save, name='messages')
+
+
+class EventInlineMessage(Base):
+    """
+    Message with event, shared by admin with inline mode, which is updated on changes of event
+    """
+    event = ForeignKey('Event', on_delete=DO_NOTHING, related_name='inline_messages')
+    inline_message_id = CharField(max_length=256, unique=True)
+    last_rendered_hash = CharField(max_length=32, default='')  # see sync.render_hash
 
 
 class ForwardMessage(Base):
@@ -210,13 +368,31 @@ class Event(Base):
     status = TinyInt(choices=STATUSES, default=STATUS_REGISTER_OPEN)
     name = CharField(max_length=256)
     description = TextField(max_length=2048)
+    version = PositiveIntegerField(default=0, editable=False)  # bumped on changes of rendered event, see handlers.render_event
 
     participants: ReverseRelation[Participant]
     messages: ReverseRelation[Message]
+    inline_messages: ReverseRelation[EventInlineMessage]
+
+    class Meta:
+        indexes = [
+            Index(fields=['admin', 'status'], name='event_admin_status_idx'),  # open events of admin
+        ]
 
     def __str__(self):
         return f'Event({self.name}, {self.description[:100]}, by {self.admin})'
 
+    def update(self, **kwargs) -> Event:
+        Event.objects.filter(id=self.id).update(version=F('version') + 1, **kwargs)
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        self.__dict__.pop('version', None)  # deferred, will be loaded again if needed
+        return self
+
+    def bump_version(self):
+        Event.objects.filter(id=self.id).update(version=F('version') + 1)
+        self.__dict__.pop('version', None)
+
     def get_type_text(self, prefix, _):
         if self.type == self.TYPE_SANTA:
             if prefix == 'to':
@@ -254,6 +430,33 @@ class Event(Base):
         else:
             return _('UNDEFINED')
 
+    def distribute_participants(self):
+        """
+        Gives each participant secret good buddy, all participants make one cycle of gifts
+        """
+        with transaction.atomic():
+            ids = list(self.participants.values_list('id', flat=True))
+            buddy_ids = [ids[buddy] for buddy in single_cycle(len(ids))]
+
+            # secret_good_buddy is unique, so old buddies are cleared first
+            self.participants.exclude(secret_good_buddy=None).update(secret_good_buddy=None)
+            if connection.vendor != 'postgresql':
+                Participant.objects.bulk_update(
+                    [Participant(id=id, secret_good_buddy_id=buddy_id) for id, buddy_id in zip(ids, buddy_ids)],
+                    ['secret_good_buddy'],
+                    batch_size=1000,
+                )
+                return
+
+            # bulk_update builds CASE WHEN for each row, which is slow for thousands of participants
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {Participant._meta.db_table} SET secret_good_buddy_id = buddy.id '
+                    f'FROM unnest(%s::bigint[], %s::bigint[]) AS buddy(participant_id, id) '
+                    f'WHERE {Participant._meta.db_table}.id = buddy.participant_id',
+                    [ids, buddy_ids],
+                )
+
 
 class Participant(Base):
     user = ForeignKey(User, on_delete=DO_NOTHING, related_name='participants')
@@ -267,6 +470,73 @@ class Participant(Base):
 class CallbackMessage(Base):
     handler_id = TinyInt()
     group_id = BigIntegerField()
-    fn = PickledObjectField()
-    args = PickledObjectField()
-    kwargs = PickledObjectField()
+    key = CharField(max_length=64)  # see handler_backends.step_handler
+    data = JSONField(default=list)  # [args, kwargs]
+
+    class Meta:
+        indexes = [
+            Index(fields=['handler_id', 'group_id'], name='callback_message_group_idx'),
+        ]
+
+
+class QueuedUpdate(Base):
+    update_id = BigIntegerField(unique=True)
+    chat_id = BigIntegerField()
+    data = JSONField()
+    taken_at = DateTimeField(**NOT_REQUIRED)
+
+
+class UpdateOffset(Model):
+    """
+    Offset of getUpdates for long polling (`manage.py runbot`): all updates before it are received and saved
+    """
+    bot_id = BigIntegerField(primary_key=True)
+    offset = BigIntegerField()
+
+    @classmethod
+    def load(cls, bot_id: int) -> int:
+        return cls.objects.filter(bot_id=bot_id).values_list('offset', flat=True).first() or 0
+
+    @classmethod
+    def store(cls, bot_id: int, offset: int):
+        cls.objects.update_or_create(bot_id=bot_id, defaults={'offset': offset})
+
+
+class BotProfile(Model):
+    """
+    User of bot (getMe), saved, so processes don't request it on start
+    """
+    bot_id = BigIntegerField(primary_key=True)
+    data = JSONField()
+    updated_at = DateTimeField(auto_now=True)
+
+
+class MetricsSnapshot(Model):
+    """
+    Metrics of each process (web workers, `process_updates`, `runbot`), so any of them renders metrics of all
+    Processes, which didn't save metrics for `ttl` seconds, are merged into one retired row without gauges,
+    so sums of counters don't go back after restarts
+    """
+    RETIRED = 'retired'
+
+    process = CharField(primary_key=True, max_length=256)
+    data = JSONField()
+    updated_at = DateTimeField()
+
+    @classmethod
+    def store(cls, process: str, data: dict):
+        cls.objects.update_or_create(process=process, defaults={'data': data, 'updated_at': timezone.now()})
+
+    @classmethod
+    def collect(cls, ttl: float) -> list[dict]:
+        now = timezone.now()
+        with transaction.atomic():
+            snapshots = list(cls.objects.select_for_update())
+            alive = [s for s in snapshots if s.process != cls.RETIRED and now - s.updated_at <= timedelta(seconds=ttl)]
+            retired = [s for s in snapshots if s not in alive]
+            if any(s.process != cls.RETIRED for s in retired):
+                cls.objects.filter(process__in=[s.process for s in retired]).delete()
+                retired = [cls.objects.create(
+                    process=cls.RETIRED, data=merge((s.data for s in retired), gauges=False), updated_at=now,
+                )]
+        return [s.data for s in alive + retired]
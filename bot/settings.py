@@ -134,6 +134,75 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': DEFAULT_RENDERER_CLASSES,
 }
 
+# Processing of telegram updates:
+# '' - directly in webhook request
+# 'local' - webhook only queues update, it is processed by worker threads of web process,
+#           updates of chat are ordered only inside one process, so web must run one gunicorn worker
+# 'db' - webhook only saves update to database, it is processed by `manage.py process_updates`
+BOT_UPDATE_QUEUE = os.environ.get('BOT_UPDATE_QUEUE', '')
+BOT_UPDATE_WORKERS = int(os.environ.get('BOT_UPDATE_WORKERS', 4))
+# workers of gunicorn, which reads this variable too (Heroku sets it by size of dyno)
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+# keep index of pending next step handlers in memory, only for deploys where one process handles all updates
+BOT_HANDLER_INDEX = os.environ.get('BOT_HANDLER_INDEX') == '1'
+
+# Telegram profiles, which are not saved again, until they are changed
+BOT_USER_CACHE_SIZE = int(os.environ.get('BOT_USER_CACHE_SIZE', 10000))
+BOT_USER_CACHE_TTL = float(os.environ.get('BOT_USER_CACHE_TTL', 60))  # seconds
+# whether users blocked bot is known by sent messages, and is saved only when changed
+BOT_REACHABILITY_TTL = float(os.environ.get('BOT_REACHABILITY_TTL', 600))  # seconds
+
+# changes of event during this delay (seconds) are synced to shared messages at once
+BOT_SYNC_DELAY = float(os.environ.get('BOT_SYNC_DELAY', 2))
+BOT_SYNC_WORKERS = int(os.environ.get('BOT_SYNC_WORKERS', 8))
+
+# limits of messages, sent by bot, per second (https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this)
+BOT_SEND_RATE = float(os.environ.get('BOT_SEND_RATE', 30))
+BOT_CHAT_SEND_RATE = float(os.environ.get('BOT_CHAT_SEND_RATE', 1))
+BOT_GROUP_SEND_RATE_PER_MINUTE = float(os.environ.get('BOT_GROUP_SEND_RATE_PER_MINUTE', 20))
+
+# seconds, saved user of bot (getMe) is refreshed in background, when it's older
+BOT_PROFILE_TTL = float(os.environ.get('BOT_PROFILE_TTL', 24 * 60 * 60))
+
+# callback queries are answered at once, in parallel with handler, errors are sent to user as messages
+BOT_ANSWER_CALLBACKS_FIRST = os.environ.get('BOT_ANSWER_CALLBACKS_FIRST') == '1'
+# seconds, ids of unanswered callback queries are kept no longer, as Telegram doesn't accept late answers
+BOT_PENDING_CALLBACK_TTL = float(os.environ.get('BOT_PENDING_CALLBACK_TTL', 60))
+
+# keep-alive connections to Bot API, shared by threads of process, and timeouts (seconds) of requests
+BOT_API_POOL_SIZE = int(os.environ.get('BOT_API_POOL_SIZE', 20))
+BOT_API_CONNECT_TIMEOUT = float(os.environ.get('BOT_API_CONNECT_TIMEOUT', 5))
+BOT_API_READ_TIMEOUT = float(os.environ.get('BOT_API_READ_TIMEOUT', 30))
+# threads, which send messages of broadcasts concurrently, 0 - one by one
+BOT_API_CONCURRENCY = int(os.environ.get('BOT_API_CONCURRENCY', 0))
+
+# seconds, each process (web workers, `process_updates`, `runbot`) saves its metrics to database so often,
+# and /metrics renders sum of all processes, 0 - /metrics renders only metrics of process, which answers
+BOT_METRICS_INTERVAL = float(os.environ.get('BOT_METRICS_INTERVAL', 15))
+# seconds, metrics of processes, which didn't save them for this time (stopped), are merged into one without gauges
+BOT_METRICS_TTL = float(os.environ.get('BOT_METRICS_TTL', 600))
+
+# seconds, results of inline queries are cached by Telegram and by bot
+BOT_INLINE_CACHE_TIME = int(os.environ.get('BOT_INLINE_CACHE_TIME', 10))
+
+# messages older than retention (days) are moved by `manage.py messages_archive archive` to gzipped JSONL by months
+# directory must be on persistent disk
+MESSAGE_RETENTION_DAYS = int(os.environ.get('MESSAGE_RETENTION_DAYS', 180))
+MESSAGE_ARCHIVE_DIR = os.environ.get('MESSAGE_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
+# rendered shared event messages, can be moved to shared cache (e.g. memcached) by env
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'render': {
+        'BACKEND': os.environ.get('RENDER_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('RENDER_CACHE_LOCATION', 'render'),
+        'TIMEOUT': int(os.environ.get('RENDER_CACHE_TIMEOUT', 24 * 60 * 60)),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 django_heroku.settings(locals())
 if os.environ.get('ENV') == 'development':
     del DATABASES['default']['OPTIONS']['sslmode']
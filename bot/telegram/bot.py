@@ -1,71 +1,213 @@
 import os
-import json
 import logging
-from typing import Union, Callable, Optional
-
-from django.db import DatabaseError
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from importlib import import_module
+from time import monotonic
+from typing import Callable, Iterable, Optional, TypeVar, Union
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
 from telebot import TeleBot, types, logger
 from telebot.apihelper import ApiException, ApiTelegramException
 
 from .handler_backends import DjangoHandlerBackend
-from .utils import JSON_COMMON_DATA, get_trans
-from ..models import Message, User
+from .instrumentation import instrument_handler, instrument_update
+from .metrics import Counter, Histogram
+from .outbound import OutboundScheduler
+from .transport import PooledTransport
+from .utils import callback, get_trans
+from ..models import BotProfile, Message, User, message_journal, reachability, tg_users_cache
 
 logger.setLevel(logging.DEBUG)
 
+T = TypeVar('T')
+
+
+CallbackHandler = Callable[..., None]  # (callback_query, user, gettext, *callback data)
+
+callback_answer_time = Histogram('bot_callback_answer_seconds', 'Time from receiving callback query to its answer')
+callback_expired = Counter('bot_callback_expired_total', 'Callback queries, which were not answered in time')
+
+
+@contextmanager
+def update_scope():
+    # all messages and changes of reachability are saved at once and each telegram user is loaded only once per update
+    with message_journal.batch(), reachability.batch(), tg_users_cache.scope():
+        yield
+
+
+def report_reachability(chat_id, error: Optional[ApiTelegramException] = None):
+    if not isinstance(chat_id, int):  # username of channel
+        return
+    if error is None:
+        reachability.report(chat_id, True)
+    # bot was blocked by the user or user is deactivated, other errors (e.g. flood limits) say nothing about it
+    elif error.error_code == 403:
+        reachability.report(chat_id, False)
+
 
-CallbackDataType = Union[str, dict[str, JSON_COMMON_DATA]]  # parsed json data
+class PendingCallbacks:
+    """
+    Ids of callback queries, which are not answered yet, with time they were received
+    Telegram doesn't accept late answers, so ids are forgotten after `ttl` seconds, even if answer failed
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._received: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        expired = 0
+        while self._received and (
+            len(self._received) > self.maxsize or now - next(iter(self._received.values())) > self.ttl
+        ):
+            self._received.popitem(last=False)
+            expired += 1
+        if expired:
+            callback_expired.inc(expired)
+
+    def add(self, callback_query_id: str):
+        now = monotonic()
+        with self._lock:
+            self._received[callback_query_id] = now
+            self._expire(now)
+
+    def received_at(self, callback_query_id: str) -> Optional[float]:
+        with self._lock:
+            self._expire(monotonic())
+            return self._received.get(callback_query_id)
+
+    def discard(self, callback_query_id: str):
+        with self._lock:
+            self._received.pop(callback_query_id, None)
+
+    def __len__(self):
+        return len(self._received)
 
 
 class ExtraTeleBot(TeleBot):
-    callback_query_handlers: dict[str, CallbackDataType]
+    callback_query_handlers: dict[callback, CallbackHandler]
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        outbound: OutboundScheduler = None,
+        transport: Optional[PooledTransport] = None,
+        handlers_module: Optional[str] = None,
+        answer_callbacks_first=False,
+        pending_callback_ttl: float = 60,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
+        self.outbound = outbound or OutboundScheduler()
+        self.transport = transport
+        if transport is not None:
+            transport.install()
         self.callback_query_handlers = {}
-        self.pending_callback_ids = set()
-
-    def callback_query_handler(self, func: Callable[[types.CallbackQuery, Optional[CallbackDataType]], None], **kwargs):
+        # handlers are registered by import of module, which is deferred until first update
+        self.handlers_module = handlers_module
+        self._handlers_lock = threading.Lock()
+        self.pending_callbacks = PendingCallbacks(pending_callback_ttl)
+        # callback is answered at once, in parallel with handler, errors of handler are sent as messages
+        self.answer_callbacks_first = answer_callbacks_first
+        self.answer_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='bot-answer')
+
+    def callback_query_handler(self, func: callback, **kwargs):
         return super().callback_query_handler(func, **kwargs)
 
     def add_callback_query_handler(self, handler_dict: dict):
-        self.callback_query_handlers[handler_dict['filters']['func'].value[0]] = handler_dict['function']
+        self.callback_query_handlers[handler_dict['filters']['func']] = handler_dict['function']
+
+    def load_handlers(self):
+        if self.handlers_module is None:
+            return
+        with self._handlers_lock:
+            if self.handlers_module is not None:
+                import_module(self.handlers_module)
+                self.handlers_module = None
+
+    def process_new_updates(self, updates):
+        self.load_handlers()
+        with update_scope(), instrument_update():
+            super().process_new_updates(updates)
+
+    def _exec_task(self, task, *args, **kwargs):
+        super()._exec_task(self._scoped_task, task, *args, **kwargs)
+
+    def _scoped_task(self, task, *args, **kwargs):
+        if task == self._handle_callback_query:
+            _type, handler = args[:2]
+            labels = {'handler': handler.__name__, 'callback': _type.value[0]}
+        else:
+            labels = {'handler': getattr(task, '__name__', '')}
+        with update_scope(), instrument_handler(**labels):
+            task(*args, **kwargs)
+
+    def call_concurrently(self, calls: Iterable[Callable[[], T]]) -> list[T]:
+        """
+        Runs calls, which make requests to Bot API (e.g. messages of broadcast), by threads of transport,
+        if it has them, otherwise one by one. Lane of outbound requests is kept
+        Each thread runs its chunk of calls in one scope, so their records are saved in batches, not after each call
+        """
+        if self.transport is None or self.transport.executor is None:
+            return [call() for call in calls]
+
+        lane = self.outbound.current_lane
+        calls = list(calls)
+        size = -(-len(calls) // self.transport.concurrency) or 1
+        chunks = [calls[start:start + size] for start in range(0, len(calls), size)]
+
+        def run(chunk: list[Callable[[], T]]) -> list[T]:
+            with self.outbound.lane(lane), update_scope():
+                try:
+                    return [call() for call in chunk]
+                finally:
+                    close_old_connections()
+
+        return [result for results in self.transport.executor.map(run, chunks) for result in results]
 
     def process_new_callback_query(self, messages: list[types.CallbackQuery, ...]):
         for message in messages:
             Message.add_tg_message(message)
-            self.pending_callback_ids.add(message.id)
-            try:
-                _type, *callback_data = json.loads(message.data)
-                if _type not in self.callback_query_handlers:
-                    continue
-                if callback_data:
-                    callback_data = callback_data[0]
-            except json.JSONDecodeError:
+            self.pending_callbacks.add(message.id)
+            if (parsed := callback.parse(message.data)) is None:
+                continue
+            _type, args, kwargs = parsed
+            if (handler := self.callback_query_handlers.get(_type)) is None:
                 continue
 
             user = User.create_from_tg(message.from_user)[0]
             _ = get_trans(user.language_code)
-            args = [user, _]
-            kwargs = {}
-            if isinstance(callback_data, dict):
-                kwargs.update(callback_data)
+            if self.answer_callbacks_first:
+                self.answer_executor.submit(self._answer_pending_callback, message.id)
+            self._exec_task(self._handle_callback_query, _type, handler, message, user, _, *args, **kwargs)
+
+    def _handle_callback_query(
+        self, _type: callback, handler: CallbackHandler, cbq: types.CallbackQuery, user: User, _, /, *args, **kw,
+    ):
+        try:
+            handler(cbq, user, _, *args, **kw)
+        except (ApiException, DatabaseError, AttributeError):  # try to send error to user
+            logger.exception('Handler of callback query %s failed', cbq.data)
+            if self.answer_callbacks_first:
+                self.send_message(cbq.from_user.id, _('Server Error'))
             else:
-                args.extend(callback_data)
+                self._answer_pending_callback(cbq.id, _('Server Error'))
+        finally:  # if there was error, just answer callback to remove it from queue
+            if not self.answer_callbacks_first:  # otherwise it's answered by answer_executor
+                self._answer_pending_callback(cbq.id)
 
-            try:
-                self._exec_task(self.callback_query_handlers[_type], message, *args, **kwargs)
-            except (ApiException, DatabaseError, AttributeError):  # try to send error to user
-                logger.exception('1')
-                try:
-                    self.answer_callback_query(message.id, _('Server Error'))
-                except ApiTelegramException:
-                    logger.exception('2')
-            finally:  # if there was error, just answer callback to remove it from queue
-                try:
-                    self.answer_callback_query(message.id)
-                except ApiTelegramException:  # if callback is too old
-                    logger.exception('3')
+    def _answer_pending_callback(self, callback_query_id: str, text: Optional[str] = None):
+        try:
+            self.answer_callback_query(callback_query_id, text)
+        except ApiTelegramException:  # if callback is too old
+            logger.exception('Callback query %s was not answered', callback_query_id)
 
     def answer_callback_query(
         self,
@@ -75,33 +217,35 @@ class ExtraTeleBot(TeleBot):
         url: Optional[str] = None,
         cache_time: Optional[int] = None,
     ) -> bool:
-        if callback_query_id not in self.pending_callback_ids:
+        if (received_at := self.pending_callbacks.received_at(callback_query_id)) is None:
             return True
 
         success = super().answer_callback_query(callback_query_id, text, show_alert, url, cache_time)
         if success:
-            self.pending_callback_ids.remove(callback_query_id)
+            self.pending_callbacks.discard(callback_query_id)
+            mode = 'first' if self.answer_callbacks_first else 'last'
+            callback_answer_time.observe(monotonic() - received_at, mode=mode)
 
         return success
 
     def process_new_messages(self, new_messages: list[types.Message, ...]):
         for message in new_messages:
             Message.add_tg_message(message)
+            if message.chat.type == 'private':  # user, who writes to bot, doesn't block it
+                reachability.report(message.from_user.id, True)
         super().process_new_messages(new_messages)
 
     def send_message(self, chat_id, *args, **kwargs) -> tuple[types.Message, Message]:
         message = None
         db_message = None
         try:
-            message = super().send_message(chat_id, *args, **kwargs)
+            message = self.outbound.call(chat_id, super().send_message, chat_id, *args, **kwargs)
             db_message = Message.add_tg_message(message)
         except ApiTelegramException as e:
             print(e)
-            pass
-
-        if isinstance(chat_id, int):
-            # message.id is None - unsuccessful message - bot is blocked by user
-            User.objects.get(user_id=chat_id).update(bot_can_message=message is not None and message.id is not None)
+            report_reachability(chat_id, e)
+        else:
+            report_reachability(chat_id)
 
         return message, db_message
 
@@ -109,21 +253,19 @@ class ExtraTeleBot(TeleBot):
         message = None
         db_message = None
         try:
-            message = super().send_photo(chat_id, *args, **kwargs)
+            message = self.outbound.call(chat_id, super().send_photo, chat_id, *args, **kwargs)
             db_message = Message.add_tg_message(message)
         except ApiTelegramException as e:
             print(e)
-            pass
-
-        if isinstance(chat_id, int):
-            # message.id is None - unsuccessful message - bot is blocked by user
-            User.objects.get(user_id=chat_id).update(bot_can_message=message is not None and message.id is not None)
+            report_reachability(chat_id, e)
+        else:
+            report_reachability(chat_id)
 
         return message, db_message
 
     def edit_message_text(self, *args, **kwargs) -> Union[types.Message, bool]:
         try:
-            message = super().edit_message_text(*args, **kwargs)
+            message = self.outbound.call(kwargs.get('chat_id'), super().edit_message_text, *args, **kwargs)
             if not isinstance(message, bool):
                 Message.add_tg_message(message)
             return message
@@ -132,14 +274,17 @@ class ExtraTeleBot(TeleBot):
 
     def edit_message_media(self, *args, **kwargs) -> Union[types.Message, bool]:
         try:
-            return super().edit_message_media(*args, **kwargs)
+            return self.outbound.call(kwargs.get('chat_id'), super().edit_message_media, *args, **kwargs)
         except ApiTelegramException:
             return False
 
-    def copy_message(self, *args, **kwargs):
-        message: types.MessageID = super().copy_message(*args, **kwargs)
+    def copy_message(self, chat_id, *args, **kwargs):
+        message: types.MessageID = self.outbound.call(chat_id, super().copy_message, chat_id, *args, **kwargs)
         return message.message_id
 
+    def pin_chat_message(self, chat_id, *args, **kwargs) -> bool:
+        return self.outbound.call(chat_id, super().pin_chat_message, chat_id, *args, **kwargs)
+
     def _notify_next_handlers(self, new_messages):
         for i, message in enumerate(new_messages):
             if (getattr(message, 'text', None) or '').startswith('/'):
@@ -159,6 +304,7 @@ class ExtraTeleBot(TeleBot):
             return
         for message in new_messages:
             Message.add_tg_message(message)
+        for message in new_messages:
             if hasattr(message, 'chat'):
                 self.clear_step_handler_by_chat_id(message.chat.id)
             for message_handler in handlers:
@@ -177,8 +323,73 @@ class ExtraTeleBot(TeleBot):
 bot = ExtraTeleBot(
     os.environ.get('BOT_TOKEN'),
     parse_mode='HTML',
+    threaded=not settings.BOT_UPDATE_QUEUE,  # queue workers run handlers by themselves, to keep updates in order
     num_threads=10,
     next_step_backend=DjangoHandlerBackend(id=0),
     reply_backend=DjangoHandlerBackend(id=1),
+    outbound=OutboundScheduler(
+        rate=settings.BOT_SEND_RATE,
+        chat_rate=settings.BOT_CHAT_SEND_RATE,
+        group_rate_per_minute=settings.BOT_GROUP_SEND_RATE_PER_MINUTE,
+    ),
+    transport=PooledTransport(
+        pool_size=settings.BOT_API_POOL_SIZE,
+        connect_timeout=settings.BOT_API_CONNECT_TIMEOUT,
+        read_timeout=settings.BOT_API_READ_TIMEOUT,
+        concurrency=settings.BOT_API_CONCURRENCY,
+    ),
+    handlers_module='bot.telegram.handlers',
+    answer_callbacks_first=settings.BOT_ANSWER_CALLBACKS_FIRST,
+    pending_callback_ttl=settings.BOT_PENDING_CALLBACK_TTL,
 )
-bot_user = bot.get_me()
+
+
+class BotUser:
+    """
+    User of bot (getMe), loaded on first use from database, or from Bot API and saved to database
+    Saved user, which is older than `ttl` seconds, is used, while it's refreshed in background
+    """
+
+    def __init__(self, bot: TeleBot, ttl: float):
+        self._bot = bot
+        self._ttl = ttl
+        self._user: Optional[types.User] = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+    @property
+    def bot_id(self) -> int:
+        return int(self._bot.token.split(':')[0])
+
+    def get(self) -> types.User:
+        if self._user is None:
+            with self._lock:
+                if self._user is None:
+                    self._user = self._load()
+        return self._user
+
+    def _load(self) -> types.User:
+        if (profile := BotProfile.objects.filter(bot_id=self.bot_id).first()) is None:
+            return self.refresh()
+        if (timezone.now() - profile.updated_at).total_seconds() > self._ttl:
+            threading.Thread(target=self._refresh_in_background, name='bot-profile', daemon=True).start()
+        return types.User.de_json(profile.data)
+
+    def refresh(self) -> types.User:
+        user = self._bot.get_me()
+        BotProfile.objects.update_or_create(bot_id=self.bot_id, defaults={'data': user.to_dict()})
+        self._user = user
+        return user
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception('Failed to refresh user of bot')
+        finally:
+            close_old_connections()
+
+
+bot_user = BotUser(bot, settings.BOT_PROFILE_TTL)
@@ -0,0 +1,151 @@
+"""
+callback_data of inline buttons, which is limited by Telegram to 64 bytes:
+base64url of version byte, id of callback and its arguments, packed by types, declared for callback
+
+Version 0 is JSON `[code, [args...]]` of old buttons, it is still decoded
+"""
+import base64
+import json
+from enum import Enum
+from typing import Callable, Iterable, Optional, Sequence
+
+VERSION = 1
+MAX_SIZE = 64
+
+Encoder = Callable[[bytearray, object], None]
+Decoder = Callable[[bytes, int], tuple[object, int]]
+
+
+def _write_uint(buffer: bytearray, value: int):
+    while value > 0x7F:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_uint(data: bytes, position: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def encode_int(buffer: bytearray, value: int):
+    _write_uint(buffer, value << 1 if value >= 0 else ~value << 1 | 1)  # zigzag, for negative ids
+
+
+def decode_int(data: bytes, position: int) -> tuple[int, int]:
+    value, position = _read_uint(data, position)
+    return value >> 1 ^ -(value & 1), position
+
+
+def encode_bool(buffer: bytearray, value: bool):
+    buffer.append(bool(value))
+
+
+def decode_bool(data: bytes, position: int) -> tuple[bool, int]:
+    return bool(data[position]), position + 1
+
+
+def encode_str(buffer: bytearray, value: str):
+    value = value.encode()
+    _write_uint(buffer, len(value))
+    buffer += value
+
+
+def decode_str(data: bytes, position: int) -> tuple[str, int]:
+    size, position = _read_uint(data, position)
+    end = position + size
+    if end > len(data):
+        raise IndexError('String is out of data')
+    return data[position:end].decode(), end
+
+
+def encode_json(buffer: bytearray, value):
+    encode_str(buffer, json.dumps(value, separators=(',', ':')))
+
+
+def decode_json(data: bytes, position: int) -> tuple[object, int]:
+    value, position = decode_str(data, position)
+    return json.loads(value), position
+
+
+CODECS: dict[type, tuple[Encoder, Decoder]] = {
+    int: (encode_int, decode_int),
+    bool: (encode_bool, decode_bool),
+    str: (encode_str, decode_str),
+}
+
+
+class CallbackCodec:
+    """
+    Precompiled encoders and decoders of arguments of each callback, declared as `name = (code, *types)`
+    Trailing arguments can be omitted, handlers get their default values
+    Id of callback is its position, so new callbacks must be added only to the end
+    """
+
+    def __init__(self, callbacks: Iterable[Enum]):
+        self._encoders: dict[Enum, tuple[int, Sequence[Encoder]]] = {}
+        self._decoders: list[tuple[Enum, Sequence[Decoder]]] = []
+        self._by_code: dict[str, Enum] = {}
+        for callback_id, callback in enumerate(callbacks):
+            code, *types = callback.value
+            codecs = [CODECS.get(type_, (encode_json, decode_json)) for type_ in types]
+            self._encoders[callback] = (callback_id, tuple(encode for encode, _ in codecs))
+            self._decoders.append((callback, tuple(decode for _, decode in codecs)))
+            self._by_code[code] = callback
+
+    def encode(self, callback: Enum, args: Sequence) -> str:
+        callback_id, encoders = self._encoders[callback]
+        if len(args) > len(encoders):
+            raise ValueError(f'{callback} takes {len(encoders)} arguments, got {len(args)}')
+
+        buffer = bytearray((VERSION,))
+        _write_uint(buffer, callback_id)
+        for encode, value in zip(encoders, args):
+            encode(buffer, value)
+        data = base64.urlsafe_b64encode(buffer).rstrip(b'=').decode()
+        if len(data) > MAX_SIZE:
+            raise ValueError(f'callback_data of {callback} is longer than {MAX_SIZE} bytes: {args}')
+        return data
+
+    def decode(self, data: str) -> Optional[tuple[Enum, list, dict]]:
+        """
+        Returns callback with positional and keyword arguments, or None for unknown or broken data
+        """
+        if data.startswith('['):
+            return self._decode_json(data)
+
+        try:
+            raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+            if raw[0] != VERSION:
+                return None
+            callback_id, position = _read_uint(raw, 1)
+            callback, decoders = self._decoders[callback_id]
+            args = []
+            for decode in decoders:
+                if position == len(raw):
+                    break
+                value, position = decode(raw, position)
+                args.append(value)
+        except (ValueError, IndexError):
+            return None
+        return callback, args, {}
+
+    def _decode_json(self, data: str) -> Optional[tuple[Enum, list, dict]]:
+        try:
+            code, *callback_data = json.loads(data)
+            callback = self._by_code.get(code)
+        except (ValueError, TypeError):
+            return None
+        if callback is None:
+            return None
+
+        callback_data = callback_data[0] if callback_data else []
+        if isinstance(callback_data, dict):
+            return callback, [], callback_data
+        return callback, list(callback_data), {}
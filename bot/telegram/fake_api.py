@@ -0,0 +1,164 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from time import sleep, time
+from typing import Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from telebot import apihelper
+
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Santa', 'username': 'secret_santa_bot'}
+
+MESSAGE_METHODS = {
+    'sendMessage', 'sendPhoto', 'editMessageText', 'editMessageMedia', 'forwardMessage',
+}
+
+
+class FakeBotAPI:
+    """
+    Local HTTP server with methods of Bot API, which are used by bot
+    Records all calls, can answer with errors (e.g. 429) and simulate network latency
+
+        with FakeBotAPI() as api:
+            api.add_error('sendMessage', 429, retry_after=1)
+            bot.send_message(1, 'Hi')
+            assert api.count('sendMessage') == 2
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency: float = 0):
+        self.latency = latency
+        self.calls: list[tuple[str, dict]] = []
+        self.updates: list[dict] = []
+        self.connections = 0  # accepted, to check reuse of connections by clients
+        self._errors: dict[str, list[dict]] = {}
+        self._message_ids = count(1000000)  # not to collide with messages of bot in synthetic updates (pipeline.py)
+        self._message_dates: dict[tuple[int, int], int] = {}  # edited messages keep date, when they were sent
+        self._lock = threading.Lock()
+        self._new_updates = threading.Condition(self._lock)
+        self._previous_api_url = None
+
+        api = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+            disable_nagle_algorithm = True  # headers and body are written separately
+
+            def setup(self):
+                super().setup()
+                with api._lock:
+                    api.connections += 1
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                params = dict(parse_qsl(url.query))
+                if length := int(self.headers.get('Content-Length') or 0):
+                    body = self.rfile.read(length)
+                    if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                        params.update(parse_qsl(body.decode()))
+                status, response = api.handle(url.path.rsplit('/', 1)[-1], params)
+                data = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), RequestHandler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-bot-api', daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        self._previous_api_url = apihelper.API_URL
+        apihelper.API_URL = self.url + '/bot{0}/{1}'
+        return self
+
+    def stop(self):
+        apihelper.API_URL = self._previous_api_url
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def add_error(self, method: str, error_code: int, description='', retry_after: Optional[int] = None, times=1):
+        error = {'ok': False, 'error_code': error_code, 'description': description or f'Error {error_code}'}
+        if retry_after is not None:
+            error['parameters'] = {'retry_after': retry_after}
+        with self._lock:
+            self._errors.setdefault(method, []).extend([error] * times)
+
+    def count(self, method: Optional[str] = None) -> int:
+        with self._lock:
+            return sum(1 for name, _ in self.calls if method is None or name == method)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self._errors.clear()
+            self.connections = 0
+
+    def handle(self, method: str, params: dict) -> tuple[int, dict]:
+        if self.latency:
+            sleep(self.latency)
+
+        with self._lock:
+            self.calls.append((method, params))
+            if errors := self._errors.get(method):
+                error = errors.pop(0)
+                return error['error_code'], error
+
+        return 200, {'ok': True, 'result': self.result(method, params)}
+
+    def result(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return self.get_updates(
+                int(params.get('offset') or 0), int(params.get('limit') or 100), float(params.get('timeout') or 0),
+            )
+        if method == 'copyMessage':
+            return {'message_id': next(self._message_ids)}
+        if method in MESSAGE_METHODS:
+            if params.get('inline_message_id'):
+                return True
+            chat_id = int(params.get('chat_id') or 0)
+            message_id = int(params.get('message_id') or next(self._message_ids))
+            with self._lock:
+                date = self._message_dates.setdefault((chat_id, message_id), int(time()))
+            return {
+                'message_id': message_id,
+                'date': date,
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        return True
+
+    def add_updates(self, *updates: dict):
+        with self._new_updates:
+            self.updates.extend(updates)
+            self._new_updates.notify_all()
+
+    def get_updates(self, offset: int, limit: int, timeout: float = 0) -> list[dict]:
+        with self._new_updates:  # long polling: waits for updates up to timeout
+            self._new_updates.wait_for(
+                lambda: any(update['update_id'] >= offset for update in self.updates), min(timeout, 1),
+            )
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            return self.updates[:limit]
@@ -1,31 +1,114 @@
-from telebot import Handler
+import threading
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from telebot import Handler, logger
 from telebot.handler_backends import HandlerBackend
 
 from ..models import CallbackMessage
 
 
+step_handlers: dict[str, Callable] = {}
+
+
+def step_handler(key: str):
+    """
+    Registers function, which can be used as next step (or reply) handler
+    Only key is saved to database, so it must stay the same between deploys
+    """
+    def decorator(fn: Callable) -> Callable:
+        step_handlers[key] = fn
+        fn.step_handler_key = key
+        return fn
+
+    return decorator
+
+
+def encode_handler(handler: Handler) -> tuple[str, list]:
+    if (key := getattr(handler.callback, 'step_handler_key', None)) is None:
+        raise ValueError(f'{handler.callback} is not registered with @step_handler')
+    return key, [handler.args, handler.kwargs]
+
+
+def decode_handler(key: str, data: list) -> Optional[Handler]:
+    if (fn := step_handlers.get(key)) is None:
+        logger.warning('Step handler %s is not registered anymore', key)
+        return None
+    args, kwargs = data
+    return Handler(fn, *args, **kwargs)
+
+
 class DjangoHandlerBackend(HandlerBackend):
+    # (handler_id, group_id) of all saved handlers, shared by all backends of process
+    # index is correct only if all handlers are registered and used by this process,
+    # so it is enabled only for update queue worker (see enable_index)
+    _index: Optional[set[tuple[int, int]]] = None
+    _index_enabled = settings.BOT_HANDLER_INDEX
+    _index_lock = threading.Lock()
+
     def __init__(self, *, id, handlers=None):
         super().__init__(handlers)
         self.handler_id = id
 
+    @classmethod
+    def enable_index(cls):
+        cls._index_enabled = True
+
+    @classmethod
+    def get_index(cls) -> Optional[set[tuple[int, int]]]:
+        if not cls._index_enabled:
+            return None
+        if cls._index is None:
+            with cls._index_lock:
+                if cls._index is None:
+                    cls._index = set(CallbackMessage.objects.values_list('handler_id', 'group_id').distinct())
+        return cls._index
+
     def register_handler(self, handler_group_id, handler: Handler):
-        CallbackMessage.objects.create(
-            handler_id=self.handler_id,
-            group_id=handler_group_id,
-            fn=handler.callback,
-            args=handler.args,
-            kwargs=handler.kwargs,
-        )
+        key, data = encode_handler(handler)
+        CallbackMessage.objects.create(handler_id=self.handler_id, group_id=handler_group_id, key=key, data=data)
+        if (index := self.get_index()) is not None:
+            with self._index_lock:
+                index.add((self.handler_id, handler_group_id))
+
+    def _pop_from_index(self, handler_group_id) -> bool:
+        """
+        Returns False, if there are surely no handlers saved for this group
+        """
+        if (index := self.get_index()) is None:
+            return True
+        with self._index_lock:
+            if (self.handler_id, handler_group_id) not in index:
+                return False
+            index.discard((self.handler_id, handler_group_id))
+            return True
 
     def clear_handlers(self, handler_group_id):
-        CallbackMessage.objects.filter(handler_id=self.handler_id, group_id=handler_group_id).delete()
+        if self._pop_from_index(handler_group_id):
+            CallbackMessage.objects.filter(handler_id=self.handler_id, group_id=handler_group_id).delete()
 
     def get_handlers(self, handler_group_id):
-        callback_messages = CallbackMessage.objects.filter(
-            handler_id=self.handler_id, group_id=handler_group_id
-        )
-        handlers = [Handler(msg.fn, *msg.args, **msg.kwargs) for msg in callback_messages]
-        callback_messages.delete()
+        if not self._pop_from_index(handler_group_id):
+            return []
+
+        handlers = (decode_handler(msg.key, msg.data) for msg in self._fetch_and_delete(handler_group_id))
+        return [handler for handler in handlers if handler]
+
+    def _fetch_and_delete(self, handler_group_id) -> list[CallbackMessage]:
+        if connection.vendor == 'postgresql':
+            callback_messages = CallbackMessage.objects.raw(
+                f'DELETE FROM {CallbackMessage._meta.db_table} WHERE handler_id = %s AND group_id = %s RETURNING *',
+                [self.handler_id, handler_group_id],
+            )
+            return sorted(callback_messages, key=lambda msg: msg.id)
 
-        return handlers
+        with transaction.atomic():
+            callback_messages = list(
+                CallbackMessage.objects
+                .select_for_update()
+                .filter(handler_id=self.handler_id, group_id=handler_group_id)
+                .order_by('id')
+            )
+            CallbackMessage.objects.filter(id__in=[msg.id for msg in callback_messages]).delete()
+        return callback_messages
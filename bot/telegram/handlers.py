@@ -1,37 +1,59 @@
 import os
 import re
 import json
-from typing import Union
+from functools import partial
+from typing import Optional, Union
 from random import shuffle
 
+from django.conf import settings
+from django.core.cache import caches
 from django.db.models import Q
+from telebot import logger
 from telebot.types import (
-    Message, CallbackQuery, InlineQuery, ChosenInlineResult, InlineQueryResultArticle, InputTextMessageContent
+    Message, CallbackQuery, InlineQuery, ChosenInlineResult, InlineQueryResultArticle, InputTextMessageContent,
+    InlineKeyboardMarkup,
 )
 
 from .bot import bot, bot_user
 from .buttons import inline_buttons
+from .handler_backends import step_handler
+from .outbound import BULK
+from .sync import SyncScheduler, render_hash
 from .const import LINK_BTN, DOWN_ARROW, ADMIN, STAR, LOCK
 from .utils import get_trans, get_lang, callback as cb, get_multi_trans
-from ..models import Event, User, Participant, Message as DBMessage, ForwardMessage
+from .view_models import EventDetail, load_event_detail, load_event_details, load_user_events
+from ..models import Event, EventInlineMessage, User, Participant, ForwardMessage, reachability
 
 
 admin_users = json.loads(os.environ.get('ADMIN_IDS'))
 
 
-def get_event_lang(event: Event):
-    users = User.objects.filter(participants__event_id=event.id)
-    langs = {user.language_code for user in users}
+MAX_LISTED_PARTICIPANTS = 100  # text of message is limited by 4096 characters
+
+
+def participants_to_html(participants: list[Participant]) -> str:
+    text = ', '.join(pt.user.to_html() for pt in participants[:MAX_LISTED_PARTICIPANTS])
+    if len(participants) > MAX_LISTED_PARTICIPANTS:
+        text += f' +{len(participants) - MAX_LISTED_PARTICIPANTS}'
+    return text
+
+
+def get_event_lang(event: Event, participants: list[Participant] = None):
+    if participants is None:
+        participants = event.participants.select_related('user')
+    langs = {participant.user.language_code for participant in participants}
     if not langs:  # wtf?)
         langs = {'en'}
     _ = get_multi_trans(*langs)
     return _
 
 
-def get_join_button_text(event):
-    _ = get_event_lang(event)
+def get_join_button_text(event, participants: list[Participant] = None):
+    if participants is None:
+        participants = list(event.participants.select_related('user__user'))
+    _ = get_event_lang(event, participants)
 
-    participants_text = ', '.join(pt.user.to_html() for pt in event.participants.all())
+    participants_text = participants_to_html(participants)
     if event.status == Event.STATUS_REGISTER_OPEN:
         return _('''
 Welcome to <b>{event.name}</b>
@@ -70,17 +92,64 @@ def get_join_button_inline_buttons(event):
     )
 
 
-def sync_event(event: Event):
-    text = get_join_button_text(event)
-    buttons = get_join_button_inline_buttons(event)
+render_cache = caches['render']
 
-    for message in event.messages.all():
-        bot.edit_message_text(
-            inline_message_id=message.data['inline_message_id'],
-            text=text,
-            reply_markup=buttons,
-            disable_web_page_preview=True,
-        )
+
+def render_key(event: Event) -> str:
+    return f'event:{event.id}:{event.version}'
+
+
+def render_events(events: list[Event]) -> list[tuple[str, Optional[InlineKeyboardMarkup]]]:
+    """
+    Text and buttons of shared event messages, cached until event is changed (see Event.version)
+    """
+    rendered = render_cache.get_many([render_key(event) for event in events])
+    if missing := [event for event in events if render_key(event) not in rendered]:
+        new_rendered = {
+            render_key(detail.event): (
+                get_join_button_text(detail.event, detail.participants),
+                get_join_button_inline_buttons(detail.event),
+            )
+            for detail in load_event_details(missing)
+        }
+        render_cache.set_many(new_rendered)
+        rendered.update(new_rendered)
+    return [rendered[render_key(event)] for event in events]
+
+
+def render_event(event: Event) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    return render_events([event])[0]
+
+
+def render_and_sync_event(event_id: int):
+    event = Event.objects.get(id=event_id)
+    if not event:
+        return
+
+    text, buttons = render_event(event)
+
+    def edit(inline_message_id):
+        with bot.outbound.lane(BULK):
+            return bot.edit_message_text(
+                inline_message_id=inline_message_id,
+                text=text,
+                reply_markup=buttons,
+                disable_web_page_preview=True,
+            )
+
+    rendered_hash = render_hash(text, buttons and buttons.to_json())
+    edited = event_sync.edit_messages(
+        dict(event.inline_messages.values_list('inline_message_id', 'last_rendered_hash')), rendered_hash, edit,
+    )
+    if edited:
+        EventInlineMessage.objects.filter(inline_message_id__in=edited).update(last_rendered_hash=rendered_hash)
+
+
+event_sync = SyncScheduler(render_and_sync_event, delay=settings.BOT_SYNC_DELAY, max_workers=settings.BOT_SYNC_WORKERS)
+
+
+def sync_event(event: Event):
+    event_sync.schedule(event.id)
 
 
 def sub_user_for_event(user: User, event: Event, _):
@@ -88,6 +157,7 @@ def sub_user_for_event(user: User, event: Event, _):
     user.update(active_participant=participant)
 
     if created:
+        event.bump_version()
         sync_event(event)
 
     return created
@@ -126,6 +196,7 @@ def send_your_buddy_or_santa_start(message: Message, user: User, _):
     )
 
 
+@step_handler('send_buddy_or_santa')
 def send_your_buddy_or_santa_message(message: Message, user_id, lang, receiver_id: int, send_santa: bool):
     user: User = User.objects.get(user_id=user_id)
     receiver: User = User.objects.get(user_id=receiver_id)
@@ -204,6 +275,7 @@ def new_event_command_start(message: Message, user: User, _):
     bot.register_next(user.id, new_event_command_name, get_lang(_), user_id=user.id)
 
 
+@step_handler('new_event_name')
 def new_event_command_name(message: Message, lang, user_id: int):
     _ = get_trans(lang)
     bot.send_message(
@@ -221,6 +293,7 @@ You can use basic html, more info ''' +
     bot.register_next(user_id, new_event_command_description, lang, user_id=user_id, name=message.text)
 
 
+@step_handler('new_event_description')
 def new_event_command_description(message: Message, lang, user_id: int, name: str):
     _ = get_trans(lang)
     user = User.objects.get(user_id=user_id)
@@ -244,7 +317,7 @@ def new_event_command_description(message: Message, lang, user_id: int, name: st
     )
     msg, db_msg = bot.send_message(user.id, '_')
 
-    event_selected(msg, user, _, event.id)
+    event_selected(msg, user, _, event.id, detail=load_event_detail(event))
 
 
 @bot.message_handler(commands=['events'])
@@ -258,13 +331,8 @@ def events_settings(msg_cbq: Union[Message, CallbackQuery], user: User, _, back=
     if message.from_user.is_bot:
         edit_id = (message.message_id, message.chat.id)
 
-    events = (
-        Event.objects
-        .filter(Q(admin_id=user.id) | Q(participants__user_id=user.id))
-        .distinct('status', 'id')
-        .order_by('status', 'id')
-    )
-    if not events.exists():
+    events = load_user_events(user)
+    if not events:
         return bot.send_message(
             user.id,
             _('''
@@ -274,31 +342,29 @@ or join someone else's event
 ''')
         )
 
-    events_count = events.count()
+    events_count = len(events)
 
     if events_count == 1 and not back:
-        return event_selected(msg_cbq, user, _, events.first().id)
-
-    active_event = user.active_participant_id and user.active_participant.event_id
+        return event_selected(msg_cbq, user, _, events[0].id)
 
     text = _('Your events:') + '\n'
     if events_count > 1:
         text += f'\n{STAR} - ' + _('your active event')
-    if events.filter(admin_id=user.id).exists():
+    if any(event.is_admin for event in events):
         text += f'\n{ADMIN} - ' + _('you are admin there')
-    if events.filter(status=Event.STATUS_ENDED).exists():
+    if any(event.is_ended for event in events):
         text += f'\n{LOCK} - ' + _('already ended')
 
     buttons = inline_buttons(
         (
             (
-                (STAR if events_count > 1 and event.id == active_event else '') +
-                (ADMIN if event.admin_id == user.id else '') +
-                (LOCK if event.status == Event.STATUS_ENDED else '') +
-                f'{event.name} ({event.participants.count()})',
+                (STAR if events_count > 1 and event.is_active else '') +
+                (ADMIN if event.is_admin else '') +
+                (LOCK if event.is_ended else '') +
+                f'{event.name} ({event.participant_count})',
                 cb.events_settings.create(event.id, False, set_active),
             )
-            for event in events.all()
+            for event in events
         ),
         width=1,
     )
@@ -310,7 +376,10 @@ or join someone else's event
 
 
 @bot.callback_query_handler(cb.events_settings)
-def event_selected(msg_cbq: Union[Message, CallbackQuery], user: User, _, event_id: int, back=False, set_active=False):
+def event_selected(
+    msg_cbq: Union[Message, CallbackQuery], user: User, _, event_id: int, back=False, set_active=False,
+    detail: EventDetail = None,  # if event is already loaded by caller
+):
     edit_id = False
     if isinstance(msg_cbq, CallbackQuery):
         message = msg_cbq.message
@@ -319,11 +388,13 @@ def event_selected(msg_cbq: Union[Message, CallbackQuery], user: User, _, event_
     if message.from_user.is_bot:
         edit_id = (message.message_id, message.chat.id)
 
-    event: Event = Event.objects.get(id=event_id)
+    if detail is None:
+        detail = load_event_detail(event_id)
+    event = detail.event
     if set_active:
-        user.update(active_participant=Participant.objects.get(event_id=event_id, user_id=user.id))
+        user.update(active_participant=detail.get_participant(user.id))
     is_admin = event.admin_id == user.id
-    is_active_event = user.active_participant and user.active_participant.event_id == event_id
+    is_active_event = detail.is_active_for(user)
 
     text = (
         ((STAR + _('This is your active event') + f'{STAR}\n\n') if is_active_event else '') +
@@ -335,7 +406,7 @@ def event_selected(msg_cbq: Union[Message, CallbackQuery], user: User, _, event_
         _('Description') + f':\n{event.description}\n\n' +
         _('Type Of Event') + ': ' + event.get_type_text('', _) + '\n' +
         _('Status Of Event') + ': ' + event.get_status_text(_) + '\n\n' +
-        _('Participants') + ':\n' + ', '.join(pt.user.to_html() for pt in event.participants.all())
+        _('Participants') + ':\n' + participants_to_html(detail.participants)
     )
 
     buttons = (
@@ -345,7 +416,7 @@ def event_selected(msg_cbq: Union[Message, CallbackQuery], user: User, _, event_
 
         (_('Leave'), cb.event_user_unsub.create(event_id, 0))
         if event.status == event.STATUS_REGISTER_OPEN
-        and event.participants.count() > 1
+        and detail.participant_count > 1
         # and event.admin_id != user.id  # can admin leave own event?
         else
         (),
@@ -362,7 +433,7 @@ def event_selected(msg_cbq: Union[Message, CallbackQuery], user: User, _, event_
                 (_('Open registration'), cb.event_admin.create(event_id, 'register_open')),
                 (
                     (_('Distribute participants'), cb.event_admin.create(event_id, 'distribute_users'))
-                    if event.participants.count() > 1
+                    if detail.participant_count > 1
                     else ()
                 ),
             )
@@ -396,10 +467,11 @@ def event_selected(msg_cbq: Union[Message, CallbackQuery], user: User, _, event_
 
 @bot.callback_query_handler(cb.event_user_set_active)
 def event_user_set_active(cbq: CallbackQuery, user: User, _, event_id: int):
-    active_participant = Participant.objects.get(event_id=event_id, user_id=user.id)
+    detail = load_event_detail(event_id)
+    active_participant = detail.get_participant(user.id)
     if active_participant:
         user.update(active_participant=active_participant)
-    event_selected(cbq, user, _, event_id)
+    event_selected(cbq, user, _, event_id, detail=detail)
 
 
 @bot.callback_query_handler(cb.event_user_unsub)
@@ -424,6 +496,7 @@ def event_user_unsub(cbq: CallbackQuery, user: User, _, event_id: int, step: int
     participant = Participant.objects.get(user_id=user.id, event_id=event_id)
     if participant:
         participant.delete()
+        event.bump_version()
         other_participants = Participant.objects.filter(user_id=user.id).order_by('-created_at')
         if other_participants.exists():
             user.active_participant = other_participants.first()
@@ -450,6 +523,7 @@ def event_admin_edit_start(message: Message, user: User, _, event_id: int, edit_
     bot.register_next(user.id, event_admin_edit, get_lang(_), user.id, event_id, edit_type)
 
 
+@step_handler('event_admin_edit')
 def event_admin_edit(message: Message, lang, user_id: int, event_id: int, edit_type: str):
     _ = get_trans(lang)
     event = Event.objects.get(id=event_id)
@@ -479,43 +553,16 @@ def event_admin_type(cbq: CallbackQuery, user: User, _, event_id: int):
 def event_admin_type_edit(cbq: CallbackQuery, user: User, _, event_id, event_type):
     event = Event.objects.get(id=event_id)
     event.update(type=event_type)
-    event_selected(cbq, user, _, event_id)
+    event_selected(cbq, user, _, event_id, detail=load_event_detail(event))
     sync_event(event)
 
 
 def distribute_participants(event: Event):
-    participants: list[Participant] = list(event.participants.all())
-
-    participants_receivers = participants.copy()
-    shuffle(participants_receivers)
-    participants_senders = participants.copy()
-
-    while participants_senders[-1].id == participants_receivers[-1].id:
-        shuffle(participants_senders)
-
-    for receiver in participants_receivers:
-        index_check = 0
-        if participants_senders[index_check].id == receiver.id:
-            index_check += 1
-
-        sender = participants_senders[index_check]
-        sender.update(secret_good_buddy=receiver)
-
-        participants_senders.pop(0)
-
-    for receiver in participants_receivers:
-        if receiver.secret_good_buddy:
-            continue
-
-        # someone haven't Secret Santa...
-        for _receiver in participants_receivers:
-            _receiver.update(secret_good_buddy=None)
-        # try again
-        return distribute_participants(event)
+    event.distribute_participants()
 
     # send all participants message with info
 
-    for participant in participants_receivers:
+    def send_buddy(participant: Participant):
         _ = get_trans(participant.user.language_code)
 
         msg, db_msg = bot.send_message(
@@ -533,6 +580,20 @@ def distribute_participants(event: Event):
         )
         bot.pin_chat_message(participant.user_id, msg.message_id, True)
 
+    participants = event.participants.select_related('user', 'secret_good_buddy__user__user')
+    reachable, skipped = [], []
+    for participant in participants:
+        # who blocked bot, won't get message anyway
+        (reachable if reachability.can_message(participant.user) else skipped).append(participant)
+    if skipped:
+        logger.warning(
+            'Event %s: message with buddy was not sent to %d participants, who blocked bot: %s',
+            event.id, len(skipped), ', '.join(str(participant.user_id) for participant in skipped),
+        )
+
+    with bot.outbound.lane(BULK):
+        bot.call_concurrently(partial(send_buddy, participant) for participant in reachable)
+
 
 @bot.callback_query_handler(cb.event_admin)
 def event_admin(cbq: CallbackQuery, user: User, _, event_id: int, type: str, step: int = 0):
@@ -571,31 +632,45 @@ def event_admin(cbq: CallbackQuery, user: User, _, event_id: int, type: str, ste
         event.update(status=status)
 
     sync_event(event)
-    event_selected(cbq, user, _, event_id)
+    event_selected(cbq, user, _, event_id, detail=load_event_detail(event))
+
+
+INLINE_PAGE_SIZE = 20
 
 
 @bot.inline_handler(lambda q: True)
 def inline_query_handler(inline_query: InlineQuery, user: User, _):
     query = inline_query.query
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
 
-    q = Q(status=Event.STATUS_REGISTER_OPEN, admin=user)
-    if query:
-        q &= Q(name__icontains=query)
-    events = Event.objects.filter(q)
+    # Telegram asks for results on each typed character, so they are cached for a short time
+    key = f'inline:{user.id}:{offset}:{render_hash(query)}'
+    if (page := render_cache.get(key)) is None:
+        q = Q(status=Event.STATUS_REGISTER_OPEN, admin=user)
+        if query:
+            q &= Q(name__icontains=query)
+        events = list(Event.objects.filter(q).order_by('-id')[offset:offset + INLINE_PAGE_SIZE + 1])
 
-    return bot.answer_inline_query(
-        inline_query.id,
-        (
+        results = [
             InlineQueryResultArticle(
                 f'{event.id}|{event.name[:10]}',
                 event.name,
-                InputTextMessageContent(
-                    get_join_button_text(event), parse_mode='HTML', disable_web_page_preview=True
-                ),
-                get_join_button_inline_buttons(event),
+                InputTextMessageContent(text, parse_mode='HTML', disable_web_page_preview=True),
+                buttons,
             )
-            for event in events
-        ),
+            for event, (text, buttons) in zip(events, render_events(events[:INLINE_PAGE_SIZE]))
+        ]
+        next_offset = str(offset + INLINE_PAGE_SIZE) if len(events) > INLINE_PAGE_SIZE else ''
+        page = results, next_offset
+        render_cache.set(key, page, settings.BOT_INLINE_CACHE_TIME)
+
+    results, next_offset = page
+    return bot.answer_inline_query(
+        inline_query.id,
+        results,
+        cache_time=settings.BOT_INLINE_CACHE_TIME,
+        is_personal=True,  # events of admin
+        next_offset=next_offset,
     )
 
 
@@ -604,8 +679,15 @@ def chosen_inline_query(inline_request: ChosenInlineResult, user: User, _):
     if not inline_request.inline_message_id:
         return  # future message
 
-    event: Event = Event.objects.get(id=int(inline_request.result_id.split('|')[0]))
-    event.messages.add(*DBMessage.objects.filter(data__inline_message_id=inline_request.inline_message_id))
+    EventInlineMessage.objects.bulk_create(
+        [
+            EventInlineMessage(
+                event_id=int(inline_request.result_id.split('|')[0]),
+                inline_message_id=inline_request.inline_message_id,
+            ),
+        ],
+        ignore_conflicts=True,  # the same result can be sent twice
+    )
 
 
 @bot.message_handler(func=lambda msg: msg.content_type not in ('pinned_message',))
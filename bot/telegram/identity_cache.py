@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import monotonic
+from typing import Callable, Hashable, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class IdentityCache:
+    """
+    Objects, stored with fingerprint of data they were created (or updated) from
+    Lookup returns object only if fingerprint is the same, so caller knows when object must be saved again
+
+    Two levels:
+    - identity map of current scope (update), always returns the same object
+    - process-wide LRU of fingerprints, which objects were saved with, entries live no more than `ttl` seconds
+      Objects aren't kept between scopes, as other processes change them, each scope loads them again (`load`),
+      so only saving of unchanged data is skipped
+    """
+
+    def __init__(self, load: Callable[[Hashable], Optional[T]], maxsize: int = 10000, ttl: float = 60):
+        self.load = load
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lru: OrderedDict[Hashable, tuple[Hashable, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def scope(self):
+        outer = getattr(self._local, 'objects', None)
+        if outer is None:
+            self._local.objects = {}
+        try:
+            yield self
+        finally:
+            if outer is None:
+                self._local.objects = None
+
+    def get(self, key: Hashable, fingerprint: Hashable) -> Optional[T]:
+        objects = getattr(self._local, 'objects', None)
+        if objects is not None and (cached := objects.get(key)) and cached[0] == fingerprint:
+            return cached[1]
+
+        with self._lock:
+            cached = self._lru.get(key)
+            if cached is None:
+                return None
+            if cached[0] != fingerprint or monotonic() - cached[1] > self.ttl:
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+
+        if (obj := self.load(key)) is None:  # deleted by other process
+            self.discard(key)
+            return None
+        if objects is not None:
+            objects[key] = (fingerprint, obj)
+        return obj
+
+    def is_saved(self, key: Hashable, fingerprint: Hashable) -> bool:
+        """
+        Whether object was saved with the same data, without loading it
+        """
+        objects = getattr(self._local, 'objects', None)
+        if objects is not None and (cached := objects.get(key)) and cached[0] == fingerprint:
+            return True
+        with self._lock:
+            cached = self._lru.get(key)
+            return cached is not None and cached[0] == fingerprint and monotonic() - cached[1] <= self.ttl
+
+    def set(self, key: Hashable, fingerprint: Hashable, obj: T):
+        objects = getattr(self._local, 'objects', None)
+        if objects is not None:
+            objects[key] = (fingerprint, obj)
+
+        with self._lock:
+            self._lru[key] = (fingerprint, monotonic())
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def discard(self, key: Hashable):
+        objects = getattr(self._local, 'objects', None)
+        if objects is not None:
+            objects.pop(key, None)
+        with self._lock:
+            self._lru.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.db import connection
+
+from .metrics import Histogram, labels_key
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+update_time = Histogram('bot_update_seconds', 'Time of processing of updates')
+update_queries = Histogram('bot_update_queries', 'Database queries of processing of updates', QUERY_BUCKETS)
+handler_time = Histogram('bot_handler_seconds', 'Time of handlers, by handler and callback')
+handler_queries = Histogram('bot_handler_queries', 'Database queries of handlers', QUERY_BUCKETS)
+handler_db_time = Histogram('bot_handler_db_seconds', 'Time of database queries of handlers')
+hot_path_time = Histogram('bot_hot_path_seconds', 'Time of functions, called on each update', (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+))
+
+
+class QueryCounter:
+    """
+    Wrapper of database cursor (connection.execute_wrapper), counts queries and their time
+    """
+    __slots__ = ('count', 'time')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += perf_counter() - started_at
+            self.count += 1
+
+
+@contextmanager
+def instrument_update():
+    queries = QueryCounter()
+    started_at = perf_counter()
+    try:
+        with connection.execute_wrapper(queries):
+            yield
+    finally:
+        update_time.observe_key((), perf_counter() - started_at)
+        update_queries.observe_key((), queries.count)
+
+
+@contextmanager
+def instrument_handler(handler: str, callback: str = ''):
+    key = labels_key({'handler': handler, 'callback': callback})
+    queries = QueryCounter()
+    started_at = perf_counter()
+    try:
+        with connection.execute_wrapper(queries):
+            yield
+    finally:
+        handler_time.observe_key(key, perf_counter() - started_at)
+        handler_queries.observe_key(key, queries.count)
+        handler_db_time.observe_key(key, queries.time)
@@ -0,0 +1,67 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Hashable, TypeVar
+
+from telebot import logger
+
+from .metrics import Counter
+
+T = TypeVar('T')
+
+journal_failures = Counter('bot_journal_failures_total', 'Batches of records, which journals failed to save')
+
+
+class WriteBehindJournal:
+    """
+    Collects records inside `batch()` and saves them all at once, when the outermost batch exits
+    Records with the same key are saved only once, the last added data wins
+    Outside of batch, records are saved immediately
+    Failed batch is logged and its error is raised, records are lost, as they could fail again
+    """
+
+    def __init__(self, save: Callable[[list[T]], None], max_size: int = 100, name: str = ''):
+        self.save = save
+        self.name = name
+        self.max_size = max_size
+        self._local = threading.local()
+
+    @property
+    def _records(self) -> dict[Hashable, T]:
+        if not hasattr(self._local, 'records'):
+            self._local.records = {}
+            self._local.depth = 0
+        return self._local.records
+
+    @contextmanager
+    def batch(self):
+        self._records  # init thread local data
+        self._local.depth += 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+            if not self._local.depth:
+                self.flush()
+
+    def add(self, key: Hashable, record: T, merge: Callable[[T, T], T] = None) -> T:
+        records = self._records
+        if key in records and merge:
+            record = merge(records[key], record)
+        records[key] = record
+
+        if not self._local.depth or len(records) >= self.max_size:
+            self.flush()
+        return record
+
+    def flush(self):
+        records = list(self._records.values())
+        self._records.clear()
+        if not records:
+            return
+
+        try:
+            self.save(records)
+        except Exception:
+            journal_failures.inc(journal=self.name)
+            logger.exception('Failed to save %s records of %s journal', len(records), self.name)
+            raise
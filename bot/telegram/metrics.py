@@ -0,0 +1,285 @@
+import operator
+import os
+import socket
+import threading
+from bisect import bisect_left
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Iterable
+from uuid import uuid4
+
+from django.db import close_old_connections, connection
+from telebot import logger
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+registry: dict[str, 'Metric'] = {}
+SAMPLE_VALUES = ('value', 'buckets', 'sum', 'count')  # other keys of samples are labels
+
+
+def labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def sample_key(sample: dict) -> tuple:
+    return labels_key({name: value for name, value in sample.items() if name not in SAMPLE_VALUES})
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Metric:
+    type = ''
+
+    def __init__(self, name: str, description: str = ''):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._values = {}
+        registry[name] = self
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [{**dict(key), 'value': value} for key, value in self._values.items()]
+
+    def export(self) -> dict:
+        return {'type': self.type, 'description': self.description, 'samples': self.snapshot()}
+
+    @staticmethod
+    def render_samples(name: str, samples: list[dict]) -> list[str]:
+        """
+        Lines of Prometheus text format
+        """
+        lines = []
+        for sample in samples:
+            sample = dict(sample)
+            value = sample.pop('value')
+            lines.append(f'{name}{format_labels(sample)} {value}')
+        return lines
+
+    @staticmethod
+    def merge_samples(samples: list[dict], other: list[dict], combine: Callable = operator.add) -> list[dict]:
+        merged = {sample_key(sample): dict(sample) for sample in samples}
+        for sample in other:
+            if (current := merged.get(key := sample_key(sample))) is None:
+                merged[key] = dict(sample)
+            else:
+                current['value'] = combine(current['value'], sample['value'])
+        return list(merged.values())
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, description: str = '', getter=None, aggregate='sum'):
+        super().__init__(name, description)
+        self.getter = getter  # value is calculated only on read, e.g. queue depth
+        # values of processes are summed, 'max' - for values, which all processes read from the same source
+        self.aggregate = aggregate
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[labels_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def snapshot(self) -> list[dict]:
+        if self.getter is not None:
+            return [{'value': self.getter()}]
+        return super().snapshot()
+
+    def export(self) -> dict:
+        return {**super().export(), 'aggregate': self.aggregate}
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str = '', buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        self.observe_key(labels_key(labels), value)
+
+    def observe_key(self, key: tuple, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            if (data := self._values.get(key)) is None:
+                data = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            data['counts'][index] += 1
+            data['sum'] += value
+            data['count'] += 1
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    **dict(key),
+                    'buckets': dict(zip((*self.buckets, '+Inf'), data['counts'])),
+                    'sum': data['sum'],
+                    'count': data['count'],
+                }
+                for key, data in self._values.items()
+            ]
+
+    @staticmethod
+    def render_samples(name: str, samples: list[dict]) -> list[str]:
+        lines = []
+        for sample in samples:
+            sample = dict(sample)
+            buckets, total, count = sample.pop('buckets'), sample.pop('sum'), sample.pop('count')
+            cumulative = 0
+            for le, bucket_count in buckets.items():
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels({**sample, "le": le})} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(sample)} {total}')
+            lines.append(f'{name}_count{format_labels(sample)} {count}')
+        return lines
+
+    @staticmethod
+    def merge_samples(samples: list[dict], other: list[dict], combine: Callable = operator.add) -> list[dict]:
+        merged = {sample_key(sample): {**sample, 'buckets': dict(sample['buckets'])} for sample in samples}
+        for sample in other:
+            if (current := merged.get(key := sample_key(sample))) is None:
+                merged[key] = {**sample, 'buckets': dict(sample['buckets'])}
+                continue
+            for le, count in sample['buckets'].items():
+                current['buckets'][le] = current['buckets'].get(le, 0) + count
+            current['sum'] += sample['sum']
+            current['count'] += sample['count']
+        return list(merged.values())
+
+
+def timed(histogram: Histogram, **labels) -> Callable[[Callable], Callable]:
+    """
+    Decorator, which observes time of each call of function
+    """
+    key = labels_key(labels)
+
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started_at = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe_key(key, perf_counter() - started_at)
+
+        return wrapper
+
+    return decorator
+
+
+METRIC_TYPES: dict[str, type[Metric]] = {metric.type: metric for metric in (Counter, Gauge, Histogram)}
+
+
+def export() -> dict[str, dict]:
+    """
+    Metrics of this process: type, description and samples by names, as JSON
+    """
+    return {name: metric.export() for name, metric in registry.items()}
+
+
+def merge(exports: Iterable[dict[str, dict]], gauges=True) -> dict[str, dict]:
+    """
+    Metrics of several processes: counters and histograms are summed, gauges - by their `aggregate`
+    """
+    merged = {}
+    for data in exports:
+        for name, metric in data.items():
+            if metric['type'] == Gauge.type and not gauges:
+                continue
+            if (current := merged.get(name)) is None:
+                merged[name] = {**metric, 'samples': list(metric['samples'])}
+            else:
+                combine = max if metric.get('aggregate') == 'max' else operator.add
+                current['samples'] = METRIC_TYPES[metric['type']].merge_samples(
+                    current['samples'], metric['samples'], combine,
+                )
+    return merged
+
+
+def snapshot(data: dict[str, dict] = None) -> dict[str, list[dict]]:
+    data = export() if data is None else data
+    return {name: metric['samples'] for name, metric in data.items()}
+
+
+def render(data: dict[str, dict] = None) -> str:
+    """
+    All metrics in Prometheus text format, of this process or exported ones
+    """
+    data = export() if data is None else data
+    lines = []
+    for name, metric in data.items():
+        lines.append(f'# HELP {name} {metric["description"]}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        lines.extend(METRIC_TYPES[metric['type']].render_samples(name, metric['samples']))
+    return '\n'.join(lines) + '\n'
+
+
+class Publisher:
+    """
+    Saves metrics of this process every `interval` seconds by `save(process, export())`,
+    so any process (web worker, `process_updates`, `runbot`) can render metrics of all processes
+    """
+
+    def __init__(self, save: Callable[[str, dict], None], interval: float):
+        self.save = save
+        self.interval = interval
+        self.process = f'{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}'  # pid is reused after restart
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self):
+        try:
+            self.save(self.process, export())
+        except Exception:
+            logger.exception('Failed to publish metrics')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.publish()
+            close_old_connections()
+        connection.close()
+
+    def start(self) -> 'Publisher':
+        with self._lock:
+            if self.interval > 0 and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-publisher', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Metrics of stopped process are published the last time, so its counters are kept
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.interval > 0:
+            self.publish()
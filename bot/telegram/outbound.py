@@ -0,0 +1,139 @@
+import threading
+from contextlib import contextmanager
+from time import monotonic
+from typing import Callable, Union
+
+from telebot import logger
+from telebot.apihelper import ApiTelegramException
+
+from .metrics import Counter, Histogram
+
+
+INTERACTIVE = 0  # answers to user actions
+BULK = 1  # broadcasts, sync of shared messages
+
+outbound_wait_time = Histogram('bot_outbound_wait_seconds', 'Time, which request waited for rate limits')
+outbound_retries = Counter('bot_outbound_retries_total', 'Requests retried after 429 Too Many Requests')
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now: float, reserved: float = 0) -> float:
+        """
+        Seconds to wait for the next token, if `reserved` tokens must be left for others
+        """
+        self._refill(now)
+        return max(self.paused_until - now, (1 + reserved - self.tokens) / self.rate, 0)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        self.paused_until = max(self.paused_until, until)
+
+    def is_idle(self, now: float) -> bool:
+        return self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class OutboundScheduler:
+    """
+    Rate limits of Bot API requests: global, per chat and per group
+    Requests of INTERACTIVE lane go first: BULK requests leave global tokens for INTERACTIVE ones, which are waiting
+    Requests are retried after `retry_after` seconds on 429 Too Many Requests
+
+        with scheduler.lane(BULK):
+            scheduler.call(chat_id, api_method, chat_id, ...)
+    """
+
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, rate=30, chat_rate=1, chat_burst=3, group_rate_per_minute=20, max_retries=3):
+        self.global_bucket = TokenBucket(rate, rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate_per_minute = group_rate_per_minute
+        self.max_retries = max_retries
+        self._buckets: dict[Union[int, str], list[TokenBucket]] = {}
+        self._waiting = [0, 0]  # by lanes
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    @contextmanager
+    def lane(self, priority: int):
+        previous = self.current_lane
+        self._local.lane = priority
+        try:
+            yield
+        finally:
+            self._local.lane = previous
+
+    @property
+    def current_lane(self) -> int:
+        return getattr(self._local, 'lane', INTERACTIVE)
+
+    def _chat_buckets(self, chat_id: Union[int, str, None], now: float) -> list[TokenBucket]:
+        if chat_id is None:  # e.g. inline messages
+            return []
+        if (buckets := self._buckets.get(chat_id)) is None:
+            if len(self._buckets) >= self.MAX_CHAT_BUCKETS:
+                self._buckets = {key: value for key, value in self._buckets.items() if not value[0].is_idle(now)}
+            buckets = self._buckets[chat_id] = [TokenBucket(self.chat_rate, self.chat_burst)]
+            if isinstance(chat_id, int) and chat_id < 0:  # groups and channels
+                rate = self.group_rate_per_minute
+                buckets.append(TokenBucket(rate / 60, rate))
+        return buckets
+
+    def acquire(self, chat_id: Union[int, str, None]):
+        lane = self.current_lane
+        started_at = now = monotonic()
+        with self._condition:
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    now = monotonic()
+                    buckets = [self.global_bucket, *self._chat_buckets(chat_id, now)]
+                    reserved = self._waiting[INTERACTIVE] if lane == BULK else 0
+                    delay = max(
+                        [self.global_bucket.delay(now, reserved=reserved)]
+                        + [bucket.delay(now) for bucket in buckets[1:]]
+                    )
+                    if delay <= 0:
+                        for bucket in buckets:
+                            bucket.take(now)
+                        break
+                    self._condition.wait(delay)
+            finally:
+                self._waiting[lane] -= 1
+                self._condition.notify_all()
+        outbound_wait_time.observe(now - started_at, lane='bulk' if lane == BULK else 'interactive')
+
+    def pause(self, chat_id: Union[int, str, None], seconds: float):
+        until = monotonic() + seconds
+        with self._condition:
+            self.global_bucket.pause(until)  # flood control may be for the whole bot
+            for bucket in self._chat_buckets(chat_id, monotonic()):
+                bucket.pause(until)
+
+    def call(self, chat_id: Union[int, str, None], fn: Callable, /, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self.acquire(chat_id)
+            try:
+                return fn(*args, **kwargs)
+            except ApiTelegramException as e:
+                if e.error_code != 429 or attempt == self.max_retries:
+                    raise
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after') or 1
+                logger.warning('Too many requests to chat %s, retry after %s seconds', chat_id, retry_after)
+                outbound_retries.inc()
+                self.pause(chat_id, retry_after)
@@ -0,0 +1,80 @@
+import threading
+from collections import OrderedDict
+from contextlib import AbstractContextManager
+from time import monotonic
+from typing import Callable, Optional
+
+from .journal import WriteBehindJournal
+
+
+class ReachabilityTracker:
+    """
+    Whether users can receive messages of bot (e.g. they didn't block it), known by results of sent messages
+    State is kept in memory for `ttl` seconds, as other processes can change it too
+    Only changes of state are saved, in batches of write-behind journal, so usual sends make no queries
+    State, which failed to save, is forgotten, so it's loaded from database again
+    """
+
+    def __init__(
+        self, save: Callable[[list[tuple[int, bool]]], None], maxsize: int = 10000, ttl: float = 600, batch_size=100,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.save = save
+        self.journal = WriteBehindJournal(self._save, batch_size, name='reachability')
+        self._known: OrderedDict[int, tuple[bool, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _save(self, records: list[tuple[int, bool]]):
+        try:
+            self.save(records)
+        except Exception:
+            with self._lock:
+                for user_id, _ in records:
+                    self._known.pop(user_id, None)
+            raise
+
+    def batch(self) -> AbstractContextManager:
+        return self.journal.batch()
+
+    def get(self, user_id: int) -> Optional[bool]:
+        with self._lock:
+            if (known := self._known.get(user_id)) is None:
+                return None
+            if monotonic() - known[1] > self.ttl:
+                del self._known[user_id]
+                return None
+            return known[0]
+
+    def _set(self, user_id: int, reachable: bool):
+        with self._lock:
+            self._known[user_id] = (reachable, monotonic())
+            self._known.move_to_end(user_id)
+            while len(self._known) > self.maxsize:
+                self._known.popitem(last=False)
+
+    def remember(self, user_id: int, reachable: bool):
+        """
+        State, which is loaded from database, it isn't saved again
+        """
+        if self.get(user_id) is None:
+            self._set(user_id, reachable)
+
+    def report(self, user_id: int, reachable: bool):
+        if self.get(user_id) == reachable:
+            return
+        self._set(user_id, reachable)
+        self.journal.add(user_id, (user_id, reachable))
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
+
+    def can_message(self, user) -> bool:
+        """
+        Broadcasts skip users, who are known to block bot
+        """
+        if (reachable := self.get(user.id)) is None:
+            self.remember(user.id, user.bot_can_message)
+            return user.bot_can_message
+        return reachable
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from django.db import connection
+from telebot import logger
+
+from .metrics import Counter
+
+
+sync_requests = Counter('bot_sync_requests_total', 'Requests to sync shared event messages')
+sync_edits = Counter('bot_sync_edits_total', 'Edits of shared event messages')
+
+
+def render_hash(*parts) -> str:
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+class SyncScheduler:
+    """
+    Requests to sync the same event during `delay` seconds are merged into one sync
+    Edits of messages are sent concurrently, by no more than `max_workers` threads
+    """
+
+    def __init__(self, sync: Callable[[int], None], delay: float, max_workers: int):
+        self.sync = sync
+        self.delay = delay
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot-sync')
+        self._pending: dict[int, threading.Timer] = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, event_id: int):
+        if self.delay <= 0:
+            sync_requests.inc(result='synced')
+            return self.sync(event_id)
+
+        with self._lock:
+            if event_id in self._pending:
+                sync_requests.inc(result='merged')
+                return
+            timer = threading.Timer(self.delay, self._run, (event_id,))
+            timer.daemon = True
+            self._pending[event_id] = timer
+            sync_requests.inc(result='scheduled')
+        timer.start()
+
+    def _run(self, event_id: int):
+        with self._lock:
+            self._pending.pop(event_id, None)
+
+        try:
+            self.sync(event_id)
+        except Exception:
+            logger.exception('Sync of event %s failed', event_id)
+        finally:
+            connection.close()  # thread of timer ends, its connection wouldn't be closed otherwise
+
+    def edit_messages(self, messages: dict[str, str], rendered_hash: str, edit: Callable[[str], bool]) -> list[str]:
+        """
+        Edits messages (last rendered hash by id), which were rendered differently, returns ids of edited messages
+        """
+        futures = {
+            message_id: self.executor.submit(edit, message_id)
+            for message_id, last_rendered_hash in messages.items()
+            if last_rendered_hash != rendered_hash
+        }
+
+        edited = []
+        for message_id, future in futures.items():
+            try:
+                success = future.result()
+            except Exception:
+                logger.exception('Edit of message %s failed', message_id)
+                success = False
+            if success:
+                edited.append(message_id)
+
+        stats = {'sent': len(edited), 'failed': len(futures) - len(edited), 'skipped': len(messages) - len(futures)}
+        for result, count in stats.items():
+            sync_edits.inc(count, result=result)
+        logger.info('Synced %s messages: %s', len(messages), stats)
+        return edited
@@ -0,0 +1,96 @@
+import gettext
+import os
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from django.conf import settings
+
+
+class Translation:
+    """
+    Drop-in replacement of `translation(lang).gettext`: `_('text')`
+    With many languages, translations to all of them are joined by new line
+    """
+
+    __slots__ = ('catalog', 'langs', 'messages')
+
+    def __init__(self, catalog: 'Catalog', langs: frozenset[str]):
+        self.catalog = catalog
+        self.langs = langs
+        self.messages = catalog.messages
+
+    def __call__(self, msgid: str) -> str:
+        if (text := self.messages.get((self.langs, msgid))) is not None:
+            return text
+        return self.catalog.gettext(self.langs, msgid)
+
+    def language(self) -> str:
+        return min(self.langs)
+
+    def __repr__(self):
+        return f'Translation({", ".join(sorted(self.langs))})'
+
+
+class Catalog:
+    """
+    All messages of locale/*/LC_MESSAGES/django.mo, loaded once, in one table by (frozenset(langs), msgid)
+    Translations to many languages are added to the table on first use
+    Like in Django, messages of unknown languages and missing messages are taken from LANGUAGE_CODE
+    """
+
+    def __init__(self, locale_paths: Iterable[str], languages: Iterable[str], default: str, domain='django'):
+        self.default = default
+        self.languages: set[str] = set()
+        self.messages: dict[tuple[frozenset[str], str], str] = {}
+        self._translations: dict[frozenset[str], Translation] = {}
+        self._translations_by_codes: dict[tuple[Optional[str], ...], Translation] = {}
+
+        for lang in languages:
+            messages = {}
+            for path in reversed(locale_paths):  # first path has priority, as in Django
+                if os.path.exists(filename := os.path.join(path, lang, 'LC_MESSAGES', f'{domain}.mo')):
+                    with open(filename, 'rb') as file:
+                        messages.update(gettext.GNUTranslations(file)._catalog)
+            messages.pop('', None)  # metadata
+            self.languages.add(lang)
+            self.messages.update(((frozenset([lang]), msgid), text) for msgid, text in messages.items())
+
+        self.known_msgids = {msgid for _, msgid in self.messages}
+
+    @lru_cache(maxsize=1024)
+    def resolve(self, lang: Optional[str]) -> str:
+        lang = (lang or '').lower().replace('_', '-')
+        for candidate in (lang, lang.split('-')[0]):
+            if candidate in self.languages:
+                return candidate
+        return self.default
+
+    def get(self, *langs: Optional[str]) -> Translation:
+        try:
+            return self._translations_by_codes[langs]
+        except KeyError:
+            return self._add_translation(langs)
+
+    def _add_translation(self, langs: tuple[Optional[str], ...]) -> Translation:
+        key = frozenset(self.resolve(lang) for lang in langs) or frozenset([self.default])
+        if (translation := self._translations.get(key)) is None:
+            translation = self._translations[key] = Translation(self, key)
+        self._translations_by_codes[langs] = translation
+        return translation
+
+    def gettext(self, langs: frozenset[str], msgid: str) -> str:
+        if (text := self.messages.get((langs, msgid))) is not None:
+            return text
+
+        text = '\n'.join(self._gettext(lang, msgid) for lang in sorted(langs))
+        if msgid in self.known_msgids:  # don't remember formatted and other dynamic strings
+            self.messages[langs, msgid] = text
+        return text
+
+    def _gettext(self, lang: str, msgid: str) -> str:
+        if (text := self.messages.get((frozenset([lang]), msgid))) is not None:
+            return text
+        return self.messages.get((frozenset([self.default]), msgid), msgid)
+
+
+catalog = Catalog(settings.LOCALE_PATHS, (code for code, _ in settings.LANGUAGES), settings.LANGUAGE_CODE)
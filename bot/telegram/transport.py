@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+from .metrics import Counter, Histogram
+
+
+api_requests = Counter('bot_api_requests_total', 'Requests to Bot API')
+api_request_time = Histogram('bot_api_request_seconds', 'Time of requests to Bot API')
+api_connections = Counter('bot_api_connections_total', 'New connections to Bot API, other requests reuse them')
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        api_connections.inc(scheme=self.scheme)
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        api_connections.inc(scheme=self.scheme)
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+
+class PooledTransport:
+    """
+    Sender of Bot API requests (apihelper.CUSTOM_REQUEST_SENDER) with one session for all threads of process,
+    which keeps up to `pool_size` keep-alive connections, threads wait for free connection, when all are busy
+    If `concurrency` is set, bot can send requests of broadcasts by this number of threads (see bot.call_concurrently)
+    """
+
+    def __init__(self, pool_size=20, connect_timeout: float = 5, read_timeout: float = 30, concurrency=0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = requests.Session()
+        adapter = PooledAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.concurrency = concurrency
+        self.executor = (
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bot-api') if concurrency > 1 else None
+        )
+
+    def install(self):
+        # apihelper passes these timeouts to sender, long polling gets longer read timeout
+        apihelper.CONNECT_TIMEOUT = self.connect_timeout
+        apihelper.READ_TIMEOUT = self.read_timeout
+        apihelper.CUSTOM_REQUEST_SENDER = self
+
+    def __call__(self, method: str, url: str, params=None, files=None, timeout=None, proxies: Optional[dict] = None):
+        endpoint = url.rsplit('/', 1)[-1]
+        started_at = monotonic()
+        status = 'error'
+        try:
+            response = self.session.request(
+                method, url, params=params, files=files, timeout=timeout, proxies=proxies,
+            )
+            status = response.status_code
+            return response
+        finally:
+            api_request_time.observe(monotonic() - started_at, method=endpoint)
+            api_requests.inc(method=endpoint, status=status)
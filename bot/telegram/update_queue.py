@@ -0,0 +1,248 @@
+import json
+import queue
+import threading
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from requests import RequestException
+from telebot import apihelper, logger, types
+from telebot.apihelper import ApiException
+
+from .bot import bot
+from .metrics import Counter, Gauge, Histogram
+from ..models import QueuedUpdate, UpdateOffset
+
+
+CHAT_UPDATE_TYPES = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post', 'callback_query',
+    'inline_query', 'chosen_inline_result', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+queue_wait_time = Histogram('bot_update_queue_wait_seconds', 'Time between receiving update and start of processing')
+queue_process_time = Histogram('bot_update_process_seconds', 'Time of processing one update')
+queue_updates = Counter('bot_update_queue_updates_total', 'Updates processed by queue workers')
+
+
+def get_update_chat_id(update: dict) -> int:
+    for update_type in CHAT_UPDATE_TYPES:
+        if not (data := update.get(update_type)):
+            continue
+        if chat := (data.get('chat') or (data.get('message') or {}).get('chat')):
+            return chat['id']
+        if user := data.get('from'):
+            return user['id']
+    return 0  # updates without chat (polls, etc.) are processed in one shard
+
+
+class ShardedExecutor:
+    """
+    Worker threads, each with its own queue
+    Tasks with the same key (chat id) always go to the same thread, so they are executed in order
+    """
+
+    def __init__(self, num_workers: int, max_in_flight: Optional[int] = None, name='bot-worker'):
+        self.num_workers = num_workers
+        self.name = name
+        self.queues = [queue.Queue() for _ in range(num_workers)]
+        self.threads = []
+        self.in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.threads:
+                return
+            for i, tasks in enumerate(self.queues):
+                thread = threading.Thread(target=self._work, args=(tasks,), name=f'{self.name}-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def depth(self) -> int:
+        return sum(tasks.qsize() for tasks in self.queues)
+
+    def submit(self, key: int, fn: Callable, *args, **kwargs):
+        if self.in_flight:
+            self.in_flight.acquire()  # backpressure: wait until some task is done
+        self.start()
+        self.queues[key % self.num_workers].put((fn, args, kwargs))
+
+    def shutdown(self, wait=True):
+        for tasks in self.queues:
+            tasks.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+        self.threads = []
+
+    def _work(self, tasks: queue.Queue):
+        while (task := tasks.get()) is not None:
+            fn, args, kwargs = task
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logger.exception('Task failed')
+            finally:
+                close_old_connections()
+                if self.in_flight:
+                    self.in_flight.release()
+        connections.close_all()  # connections of this thread
+
+
+def process_update(data: dict, received_at: float):
+    started_at = monotonic()
+    queue_wait_time.observe(max(0.0, timezone.now().timestamp() - received_at))
+    bot.process_new_updates([types.Update.de_json(data)])
+    queue_process_time.observe(monotonic() - started_at)
+    queue_updates.inc()
+
+
+def parse_update(raw: str) -> dict:
+    data = json.loads(raw)
+    if not isinstance(data, dict) or not isinstance(data.get('update_id'), int):
+        raise ValueError('Not a telegram update')
+    return data
+
+
+class LocalUpdateQueue:
+    """
+    In-process queue: updates are processed by worker threads of the same web process
+    Updates, which were not processed before restart, are lost
+    Updates of chat are ordered only inside one process, so web must run only one worker
+    """
+
+    def __init__(self, num_workers: int):
+        self.executor = ShardedExecutor(num_workers)
+        Gauge('bot_update_queue_depth', 'Updates waiting for processing', getter=self.executor.depth)
+
+    def put(self, raw: str):
+        data = parse_update(raw)
+        self.executor.submit(get_update_chat_id(data), process_update, data, timezone.now().timestamp())
+
+
+class DatabaseUpdateQueue:
+    """
+    Updates are saved to database and processed by `manage.py process_updates`
+    Only one `process_updates` process should be run, to keep updates of one chat in order
+    """
+
+    def __init__(self, num_workers: int):
+        self.executor = ShardedExecutor(num_workers, max_in_flight=num_workers * 2)
+        # web and `process_updates` count the same saved updates
+        Gauge(
+            'bot_update_queue_depth', 'Updates waiting for processing',
+            getter=QueuedUpdate.objects.count, aggregate='max',
+        )
+
+    def put(self, raw: str):
+        data = parse_update(raw)
+        QueuedUpdate.objects.bulk_create(  # telegram can send the same update again, if we answered too slow
+            [QueuedUpdate(update_id=data['update_id'], chat_id=get_update_chat_id(data), data=data)],
+            ignore_conflicts=True,
+        )
+
+    def _process(self, queued_update: QueuedUpdate):
+        try:
+            process_update(queued_update.data, queued_update.created_at.timestamp())
+        finally:
+            QueuedUpdate.objects.filter(id=queued_update.id).delete()
+
+    def claim(self, limit: int) -> list[QueuedUpdate]:
+        with transaction.atomic():
+            updates = list(
+                QueuedUpdate.objects
+                .select_for_update(skip_locked=True)
+                .filter(taken_at=None)
+                .order_by('id')[:limit]
+            )
+            QueuedUpdate.objects.filter(id__in=[update.id for update in updates]).update(taken_at=timezone.now())
+        return updates
+
+    def drain(self, stop: threading.Event, batch_size=100, interval=0.5):
+        # updates taken by previous (killed) worker are processed again
+        QueuedUpdate.objects.exclude(taken_at=None).update(taken_at=None)
+
+        while not stop.is_set():
+            updates = self.claim(batch_size)
+            for queued_update in updates:
+                self.executor.submit(queued_update.chat_id, self._process, queued_update)
+            if not updates:
+                sleep(interval)
+
+        self.executor.shutdown()
+
+
+class PollingUpdateQueue:
+    """
+    Updates are received by long polling of getUpdates (`manage.py runbot`) and processed by workers, sharded by chat
+    getUpdates confirms all updates before its offset and Telegram doesn't send them again, so each batch is saved
+    to database (QueuedUpdate) with the next offset before the next getUpdates, update is deleted, when it's processed
+    Updates, which were not processed before restart, are processed again on start
+    No more than `max_in_flight` updates are processed at once
+    Webhook can't be set in polling mode, so saved updates aren't taken by `process_updates`
+    """
+
+    def __init__(self, token: str, num_workers: int, max_in_flight=100):
+        self.token = token
+        self.bot_id = int(token.split(':')[0])
+        self.executor = ShardedExecutor(num_workers, max_in_flight=max_in_flight)
+        self._next_update_id = 0  # first update, which is not received yet
+        Gauge('bot_update_queue_depth', 'Updates waiting for processing', getter=self.executor.depth)
+
+    def _process(self, queued_update: QueuedUpdate):
+        try:
+            process_update(queued_update.data, queued_update.created_at.timestamp())
+        finally:
+            QueuedUpdate.objects.filter(update_id=queued_update.update_id).delete()
+
+    def save(self, updates: list[dict]) -> list[QueuedUpdate]:
+        queued_updates = [
+            QueuedUpdate(update_id=data['update_id'], chat_id=get_update_chat_id(data), data=data)
+            for data in updates if data['update_id'] >= self._next_update_id  # not received before restart
+        ]
+        if updates:
+            self._next_update_id = max(self._next_update_id, updates[-1]['update_id'] + 1)
+        with transaction.atomic():
+            QueuedUpdate.objects.bulk_create(queued_updates, ignore_conflicts=True)
+            UpdateOffset.store(self.bot_id, self._next_update_id)
+        return queued_updates
+
+    def dispatch(self, queued_updates: list[QueuedUpdate]):
+        for queued_update in queued_updates:
+            self.executor.submit(queued_update.chat_id, self._process, queued_update)  # waits, if too many
+
+    def poll(self, stop: threading.Event, timeout=20, limit=100, interval=1.0):
+        """
+        After `stop` is set, waits for current getUpdates (up to `timeout` seconds) and for dispatched updates
+        """
+        self._next_update_id = UpdateOffset.load(self.bot_id)
+        self.dispatch(list(QueuedUpdate.objects.order_by('update_id')))  # not processed before restart
+
+        while not stop.is_set():
+            try:
+                updates = apihelper.get_updates(self.token, self._next_update_id, limit, long_polling_timeout=timeout)
+            except (ApiException, RequestException):
+                logger.exception('Failed to get updates')
+                stop.wait(interval)
+                continue
+
+            if updates:
+                self.dispatch(self.save(updates))
+
+        self.executor.shutdown()
+
+
+def get_update_queue():
+    if settings.BOT_UPDATE_QUEUE == 'local':
+        if settings.WEB_CONCURRENCY > 1:
+            raise ImproperlyConfigured(
+                "BOT_UPDATE_QUEUE='local' keeps updates of chat in order only inside one process, "
+                "set WEB_CONCURRENCY=1 or use BOT_UPDATE_QUEUE='db'"
+            )
+        return LocalUpdateQueue(settings.BOT_UPDATE_WORKERS)
+    elif settings.BOT_UPDATE_QUEUE == 'db':
+        return DatabaseUpdateQueue(settings.BOT_UPDATE_WORKERS)
+    return None
@@ -1,38 +1,46 @@
-import json
 import random
 from enum import Enum
-from typing import Union
+from typing import Optional, Union
 import string
-from functools import partial
 
 from telebot import types
-from django.utils.translation.trans_real import translation
 from django.contrib.auth.base_user import AbstractBaseUser
 
-JSON_COMMON_DATA = Union[list[...], dict[str, ...], int, str]
-
+from .callback_data import CallbackCodec
+from .translations import Translation, catalog
 
-def get_trans(lang):
-    return translation(lang).gettext
+JSON_COMMON_DATA = Union[list[...], dict[str, ...], int, str]
 
 
-def multi_gettext(get_text_list, text, sep='\n'):
-    return sep.join(get_text(text) for get_text in get_text_list)
+def get_trans(lang: Optional[str]) -> Translation:
+    return catalog.get(lang)
 
 
-def get_multi_trans(*langs, **kwargs):
-    get_text_list = [get_trans(lang) for lang in langs]
-    return partial(multi_gettext, get_text_list, **kwargs)
+def get_multi_trans(*langs: Optional[str]) -> Translation:
+    return catalog.get(*langs)
 
 
-def get_lang(gettext):
-    return gettext.__self__.language()
+def get_lang(gettext: Translation) -> str:
+    return gettext.language()
 
 
 def random_str(n: int):
     return ''.join(random.choices(string.ascii_letters + string.digits, k=n))
 
 
+def single_cycle(n: int) -> list[int]:
+    """
+    Random permutation of range(n), which is one cycle, so nobody is mapped to himself (Sattolo's algorithm)
+    >>> sorted(single_cycle(5))
+    [0, 1, 2, 3, 4]
+    """
+    permutation = list(range(n))
+    for i in range(n - 1, 0, -1):
+        j = random.randrange(i)
+        permutation[i], permutation[j] = permutation[j], permutation[i]
+    return permutation
+
+
 def safe_join(*items, default=''):
     """
     >>> safe_join(False, 'test ', 34, (', ', 10))
@@ -63,10 +71,11 @@ def mention_user(user: AbstractBaseUser):
 
 
 class callback(Enum):
+    # encoded by position (see callback_data.py), so new callbacks are added only to the end
     user_settings = ('us', str, JSON_COMMON_DATA)  # action, value (new_event_id, etc)
-    events_main = ('em',)  # for back button in events_settings
-    events_settings = ('es', int)  # event_id (to edit)
-    event_admin = ('ea', int, str)  # event_id, action
+    events_main = ('em', bool)  # for back button in events_settings -- back
+    events_settings = ('es', int, bool, bool)  # event_id (to edit), back, set_active
+    event_admin = ('ea', int, str, int)  # event_id, action, step
     event_admin_edit = ('eae', int, str)  # event_id, edit_type
     event_admin_type = ('eat', int)  # event_id
     event_admin_type_edit = ('eate', int, str)  # event_id, type
@@ -74,4 +83,11 @@ class callback(Enum):
     event_user_unsub = ('eus', int, int)  # user event settings - leave -- event_id, step
 
     def create(self, *data: JSON_COMMON_DATA) -> str:
-        return json.dumps([self.value[0], data], separators=(',', ':'))
+        return callback_codec.encode(self, data)
+
+    @staticmethod
+    def parse(data: str) -> Optional[tuple['callback', list, dict]]:
+        return callback_codec.decode(data)
+
+
+callback_codec = CallbackCodec(callback)
@@ -0,0 +1,79 @@
+"""
+Read-only data of bot screens, each loaded by one query
+"""
+from typing import NamedTuple, Optional, Union
+
+from django.db.models import (
+    BooleanField, Count, Exists, ExpressionWrapper, OuterRef, Prefetch, Q, prefetch_related_objects,
+)
+
+from ..models import Event, Participant, User
+
+
+class UserEvent(NamedTuple):
+    id: int
+    name: str
+    status: int
+    is_admin: bool
+    participant_count: int
+    is_active: bool  # event of active participant of user
+
+    @property
+    def is_ended(self) -> bool:
+        return self.status == Event.STATUS_ENDED
+
+
+def load_user_events(user: User) -> list[UserEvent]:
+    """
+    Events, where user is admin or participant
+    """
+    user_participants = Participant.objects.filter(event=OuterRef('pk'), user_id=user.id)
+    return [
+        UserEvent(*row)
+        for row in (
+            Event.objects
+            .annotate(
+                is_participant=Exists(user_participants),
+                is_admin=ExpressionWrapper(Q(admin_id=user.id), output_field=BooleanField()),
+                participant_count=Count('participants'),
+                is_active=Exists(user_participants.filter(id=user.active_participant_id)),
+            )
+            .filter(Q(admin_id=user.id) | Q(is_participant=True))
+            .order_by('status', 'id')
+            .values_list('id', 'name', 'status', 'is_admin', 'participant_count', 'is_active')
+        )
+    ]
+
+
+class EventDetail(NamedTuple):
+    event: Event
+    participants: list[Participant]  # with users
+
+    @property
+    def participant_count(self) -> int:
+        return len(self.participants)
+
+    def get_participant(self, user_id: int) -> Optional[Participant]:
+        return next((participant for participant in self.participants if participant.user_id == user_id), None)
+
+    def is_active_for(self, user: User) -> bool:
+        return any(participant.id == user.active_participant_id for participant in self.participants)
+
+
+def load_event_details(events: list[Event]) -> list[EventDetail]:
+    """
+    Participants with users for all events at once
+    """
+    prefetch_related_objects(
+        events, Prefetch('participants', Participant.objects.select_related('user__user').order_by('id')),
+    )
+    return [EventDetail(event, list(event.participants.all())) for event in events]
+
+
+def load_event_detail(event: Union[Event, int]) -> EventDetail:
+    """
+    Event (if not loaded yet) with participants and their users
+    """
+    if not isinstance(event, Event):
+        event = Event.objects.get(id=event)
+    return load_event_details([event])[0]
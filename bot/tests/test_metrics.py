@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import MetricsSnapshot
+from ..telegram.metrics import merge
+
+
+def process_metrics(requests: int, depth: int, seconds: float) -> dict:
+    return {
+        'requests': {'type': 'counter', 'description': '', 'samples': [{'method': 'send', 'value': requests}]},
+        'depth': {'type': 'gauge', 'description': '', 'aggregate': 'max', 'samples': [{'value': depth}]},
+        'time': {'type': 'histogram', 'description': '', 'samples': [
+            {'buckets': {'1': 1, '+Inf': 0}, 'sum': seconds, 'count': 1},
+        ]},
+    }
+
+
+class MetricsSnapshotTest(TestCase):
+    def test_processes_are_merged(self):
+        MetricsSnapshot.store('web:1', process_metrics(3, 5, 0.5))
+        MetricsSnapshot.store('worker:2', process_metrics(4, 7, 0.25))
+
+        merged = merge(MetricsSnapshot.collect(ttl=60))
+        self.assertEqual(merged['requests']['samples'], [{'method': 'send', 'value': 7}])
+        self.assertEqual(merged['depth']['samples'], [{'value': 7}])
+        self.assertEqual(merged['time']['samples'], [{'buckets': {'1': 2, '+Inf': 0}, 'sum': 0.75, 'count': 2}])
+
+    def test_stopped_processes_are_retired(self):
+        MetricsSnapshot.store('web:1', process_metrics(3, 5, 0.5))
+        MetricsSnapshot.store('web:2', process_metrics(4, 7, 0.25))
+        MetricsSnapshot.objects.filter(process='web:2').update(updated_at=timezone.now() - timedelta(minutes=5))
+        MetricsSnapshot.collect(ttl=60)
+        MetricsSnapshot.store('web:3', process_metrics(1, 2, 0.5))  # restarted process
+
+        merged = merge(MetricsSnapshot.collect(ttl=60))
+        self.assertEqual(merged['requests']['samples'], [{'method': 'send', 'value': 8}])  # counters don't go back
+        self.assertEqual(merged['depth']['samples'], [{'value': 5}])  # only of running processes
+        self.assertEqual(
+            sorted(MetricsSnapshot.objects.values_list('process', flat=True)), ['retired', 'web:1', 'web:3'],
+        )
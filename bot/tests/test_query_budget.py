@@ -0,0 +1,191 @@
+"""
+Numbers of queries and Bot API calls of each handler (commands, callbacks, next steps, inline handlers)
+Handlers are run by updates, as Telegram sends them, with fake Bot API, against event with 1, 100 and 1000
+participants, whose admin and participant also have other events
+Numbers mustn't depend on amount of data, except of handlers, which send messages to all participants
+"""
+import logging
+from contextlib import ExitStack
+from itertools import count
+from typing import Callable, Union
+
+from django.core.cache import caches
+from django.db.models import OuterRef, Subquery
+from django.test import TestCase
+from telebot import logger, types
+
+from ..benchmarks import local_bot, pipeline
+from ..benchmarks.pipeline import callback_query, chosen_inline_result, inline_query, message, user as tg_user
+from ..models import AuthUser, Event, EventInlineMessage, Participant, User, message_ids, reachability, tg_users_cache
+from ..telegram.fake_api import BOT_USER
+
+EVENTS = 20  # other events of admin and participant, to render in lists
+PARTICIPANTS = 5  # of other events
+
+# (queries, Bot API calls), queries include savepoints of atomic blocks, as test runs in transaction
+# user, who sent update, is loaded once per update (1 query), profile is saved only when it's changed
+# callback query is answered (1 call), change of event is synced to its inline message (1 call)
+BUDGETS: dict[str, Union[tuple[int, int], dict[int, tuple[int, int]]]] = {
+    'start': (4, 1),
+    'start_join': (15, 2),
+    'events': (5, 1),
+    'events_main': (4, 2),
+    'events_settings_participant': (5, 2),
+    'event_user_set_active': (6, 2),
+    'event_user_unsub': (4, 2),
+    'event_user_unsub_confirm': (18, 4),
+    'start_rejoin': (15, 2),
+    'events_settings_admin': (5, 2),
+    'event_admin_edit': (5, 2),
+    'event_admin_edit_step': (9, 2),
+    'event_admin_type': (3, 2),
+    'event_admin_type_edit': (9, 2),
+    'event_admin_register_close': (10, 3),
+    'event_admin_register_open': (10, 3),
+    # each participant gets message with buddy, which is pinned, sent messages are saved by batches of 100
+    'event_admin_distribute_users': {1: (16, 7), 100: (18, 205), 1000: (36, 2005)},
+    'send_santa': (10, 1),
+    'send_santa_step': (9, 3),
+    'send_buddy': (10, 1),
+    'send_buddy_step': (8, 3),
+    'event_admin_end': (4, 2),
+    'event_admin_end_confirm': (10, 3),
+    'new_event': (5, 1),
+    'new_event_name': (4, 1),
+    'new_event_description': (15, 3),
+    # page of events, participants with users of events (to render)
+    'inline_query': (4, 1),
+    # message without id gets id from reserved block
+    'chosen_inline_result': (8, 0),
+    'any_message': (5, 1),
+}
+# callback.user_settings has no handler
+
+
+def get_budget(name: str, participants: int) -> tuple[int, int]:
+    budget = BUDGETS[name]
+    return budget[participants] if isinstance(budget, dict) else budget
+
+
+def create_users(first_id: int, count: int, language_code='en') -> list[User]:
+    auth_users = AuthUser.objects.bulk_create(
+        AuthUser(id=user_id, username=f'__{user_id}', first_name=f'User {user_id}')
+        for user_id in range(first_id, first_id + count)
+    )
+    return User.objects.bulk_create(
+        User(user=auth_user, full_name=auth_user.first_name, language_code=language_code) for auth_user in auth_users
+    )
+
+
+def create_tg_user(user_id: int, language_code='en') -> User:
+    # the same profile, as in updates, so it isn't updated by each of them
+    return User.create_from_tg(types.User.de_json(tg_user(user_id, language_code)))[0]
+
+
+def create_event(admin: User, name: str, participants: list[User], status=Event.STATUS_REGISTER_OPEN) -> Event:
+    event = Event.objects.create(admin=admin, name=name, description='', status=status)
+    Participant.objects.bulk_create(Participant(user=user, event=event) for user in participants)
+    # as if they joined it by link
+    User.objects.filter(user_id__in=[user.id for user in participants]).update(active_participant=Subquery(
+        Participant.objects.filter(event=event, user=OuterRef('pk')).values('id')[:1]
+    ))
+    return event
+
+
+def create_fixture(size: int) -> tuple[User, User, Event]:
+    """
+    Admin of event with `size` participants, user, who will join it, and the event, which is shared by inline message
+    """
+    first_id = size * 10000
+    admin, joiner = create_tg_user(first_id), create_tg_user(first_id + 1)
+
+    others = create_users(first_id + size + 1, PARTICIPANTS)
+    for number in range(EVENTS):
+        status = Event.STATUS_ENDED if number % 5 == 0 else Event.STATUS_REGISTER_OPEN
+        create_event(others[number % 2], f'Event {number}', [admin, joiner, *others], status)
+    event = create_event(admin, f'Event of {size}', [admin, *create_users(first_id + 2, size - 1)])
+    EventInlineMessage.objects.create(event=event, inline_message_id=f'inline-{size}')
+
+    admin.refresh_from_db()
+    joiner.refresh_from_db()
+    return admin, joiner, event
+
+
+def scenario(admin: User, joiner: User, event: Event) -> list[tuple[str, Callable[[], dict]]]:
+    """
+    Updates in order of usual flow: user joins event, admin edits and distributes it, users send messages
+    Participant can't leave event after sending messages (they are kept), so user leaves and joins again before
+    """
+    from ..telegram.utils import callback as cb
+
+    a, j, e = admin.id, joiner.id, event.id
+    return [
+        ('start', lambda: message(j, '/start')),
+        ('start_join', lambda: message(j, f'/start {e}')),
+        ('events', lambda: message(j, '/events')),
+        ('events_main', lambda: callback_query(j, cb.events_main.create(True))),
+        ('events_settings_participant', lambda: callback_query(j, cb.events_settings.create(e, True, False))),
+        ('event_user_set_active', lambda: callback_query(j, cb.event_user_set_active.create(e))),
+        ('event_user_unsub', lambda: callback_query(j, cb.event_user_unsub.create(e, 0))),
+        ('event_user_unsub_confirm', lambda: callback_query(j, cb.event_user_unsub.create(e, 2))),
+        ('start_rejoin', lambda: message(j, f'/start {e}')),
+        ('events_settings_admin', lambda: callback_query(a, cb.events_settings.create(e, True, False))),
+        ('event_admin_edit', lambda: callback_query(a, cb.event_admin_edit.create(e, 'name'))),
+        ('event_admin_edit_step', lambda: message(a, 'New name')),
+        ('event_admin_type', lambda: callback_query(a, cb.event_admin_type.create(e))),
+        ('event_admin_type_edit', lambda: callback_query(a, cb.event_admin_type_edit.create(e, Event.TYPE_SANTA))),
+        ('event_admin_register_close', lambda: callback_query(a, cb.event_admin.create(e, 'register_close', 0))),
+        ('event_admin_register_open', lambda: callback_query(a, cb.event_admin.create(e, 'register_open', 0))),
+        ('event_admin_distribute_users', lambda: callback_query(a, cb.event_admin.create(e, 'distribute_users', 0))),
+        ('send_santa', lambda: message(j, '/send_santa')),
+        ('send_santa_step', lambda: message(j, 'Hi, Santa')),
+        ('send_buddy', lambda: message(j, '/send_buddy')),
+        ('send_buddy_step', lambda: message(j, 'Hi, buddy')),
+        ('event_admin_end', lambda: callback_query(a, cb.event_admin.create(e, 'end', 0))),
+        ('event_admin_end_confirm', lambda: callback_query(a, cb.event_admin.create(e, 'end', 2))),
+        ('new_event', lambda: message(a, '/new_event')),
+        ('new_event_name', lambda: message(a, 'Office party')),
+        ('new_event_description', lambda: message(a, 'Friday, 18:00')),
+        ('inline_query', lambda: inline_query(a)),
+        ('chosen_inline_result', lambda: chosen_inline_result(a, f'{e}|0', f'chosen-{e}')),
+        ('any_message', lambda: message(j, 'Hello')),
+    ]
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        from ..telegram.bot import bot_user
+
+        stack = ExitStack()
+        self.addCleanup(stack.close)
+        self.bot, self.api = stack.enter_context(local_bot())
+
+        # state of process, which is kept between updates, is the same for each test
+        for cache in caches.all():
+            cache.clear()
+        tg_users_cache.clear()
+        reachability.clear()
+        message_ids._left = 0  # block of ids is reserved again
+        pipeline.update_ids = count(1)
+        bot_user.get()
+        User.create_from_tg(types.User.de_json(BOT_USER))  # sender of all messages of bot
+        self.bot.load_handlers()
+
+    def check_handlers(self, participants: int):
+        for name, update in scenario(*create_fixture(participants)):
+            queries, api_calls = get_budget(name, participants)
+            with self.subTest(handler=name, participants=participants):
+                calls_before = self.api.count()
+                # handlers of callback queries log their errors instead of raising
+                with self.assertNoLogs(logger, logging.ERROR), self.assertNumQueries(queries):
+                    self.bot.process_new_updates([types.Update.de_json(update())])
+                self.assertEqual(self.api.count() - calls_before, api_calls, 'Bot API calls')
+
+    def test_event_of_1_participant(self):
+        self.check_handlers(1)
+
+    def test_event_of_100_participants(self):
+        self.check_handlers(100)
+
+    def test_event_of_1000_participants(self):
+        self.check_handlers(1000)
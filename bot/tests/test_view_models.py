@@ -0,0 +1,43 @@
+from django.test import TestCase
+
+from ..models import AuthUser, Event, Participant, User
+from ..telegram.view_models import load_user_events
+
+EVENTS = 20
+PARTICIPANTS = 5
+
+
+def create_user(user_id: int) -> User:
+    auth_user = AuthUser.objects.create(id=user_id, username=f'__{user_id}', first_name=f'User {user_id}')
+    return User.objects.create(user=auth_user, full_name=auth_user.first_name, language_code='en')
+
+
+class LoadUserEventsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user(1000)
+        others = [create_user(1001 + i) for i in range(PARTICIPANTS)]
+        for number in range(EVENTS):
+            admin = cls.user if number % 2 else others[0]
+            status = Event.STATUS_ENDED if number % 5 == 0 else Event.STATUS_REGISTER_OPEN
+            event = Event.objects.create(admin=admin, name=f'Event {number}', description='', status=status)
+            Participant.objects.bulk_create(Participant(user=user, event=event) for user in [cls.user, *others])
+        cls.user.update(active_participant=cls.user.participants.last())
+        # event of others, user isn't in it
+        Event.objects.create(admin=others[0], name='Other', description='')
+
+    def test_one_query(self):
+        with self.assertNumQueries(1):
+            events = load_user_events(self.user)
+        self.assertEqual(len(events), EVENTS)
+
+    def test_fields(self):
+        events = {event.id: event for event in load_user_events(self.user)}
+        for event in Event.objects.filter(id__in=events).prefetch_related('participants'):
+            user_event = events[event.id]
+            self.assertEqual(user_event.name, event.name)
+            self.assertEqual(user_event.status, event.status)
+            self.assertEqual(user_event.is_admin, event.admin_id == self.user.id)
+            self.assertEqual(user_event.participant_count, len(event.participants.all()))
+            self.assertEqual(user_event.is_active, event.id == self.user.active_participant.event_id)
+            self.assertEqual(user_event.is_ended, event.status == Event.STATUS_ENDED)
@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.urls import path
 
-from .views import BotAPIView
+from .views import BotAPIView, MetricsAPIView
 from .telegram.bot import bot
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path(bot.token, BotAPIView.as_view()),
+    path(bot.token + '/metrics', MetricsAPIView.as_view()),
 ]
@@ -1,13 +1,22 @@
 import os
 from time import sleep
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.views.generic import View
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from telebot import types
 
-from .telegram.handlers import bot  # make sure handlers is registered
+from .models import MetricsSnapshot
+from .telegram import metrics
+from .telegram.bot import bot  # handlers are registered on first update
+from .telegram.update_queue import get_update_queue
+
+
+update_queue = get_update_queue()
+# started by first request, not on import (e.g. by checks of management commands)
+metrics_publisher = metrics.Publisher(MetricsSnapshot.store, settings.BOT_METRICS_INTERVAL)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -31,6 +40,26 @@ class BotAPIView(View):
         return HttpResponse('Webhook deleted')
 
     def post(self, request, *args, **kwargs):
-        bot.process_new_updates([types.Update.de_json(request.body.decode())])
+        metrics_publisher.start()
+        if update_queue is None:
+            bot.process_new_updates([types.Update.de_json(request.body.decode())])
+        else:
+            try:
+                update_queue.put(request.body.decode())
+            except ValueError:  # also json.JSONDecodeError
+                return HttpResponse('', status=400)
 
         return HttpResponse('', status=204)
+
+
+class MetricsAPIView(View):
+    def get(self, request, *args, **kwargs):
+        data = None  # metrics of this process
+        if settings.BOT_METRICS_INTERVAL > 0:  # metrics of all processes, with current ones of this process
+            metrics_publisher.start()
+            metrics_publisher.publish()
+            data = metrics.merge(MetricsSnapshot.collect(settings.BOT_METRICS_TTL))
+
+        if request.GET.get('format') == 'json':
+            return JsonResponse(metrics.snapshot(data))
+        return HttpResponse(metrics.render(data), content_type='text/plain; version=0.0.4; charset=utf-8')